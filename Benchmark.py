@@ -0,0 +1,191 @@
+# Benchmarks of the evaluation kernels for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# Times the kernels of an evaluation (building the Solution, the storage recursions, PCapTCalc, the transmission model,
+# F and F_lean) and the evaluations per second of the vectorised objective across population sizes and thread counts.
+# The traces are synthetic (Input.synthetic), so the benchmarks run without the input data, at any number of years,
+# nodes, sites per node and steps. Each kernel is called once to compile it before it is timed, and the fastest of
+# -repeat runs is reported.
+#
+# Results are written as JSON with the commit, versions and machine they were measured on. -compare reports the ratio
+# of each timing to those of an earlier results file, e.g. to check a commit for regressions:
+#     python Benchmark.py -n Super1 -years 2 -o before.json
+#     python Benchmark.py -n Super1 -years 2 -compare before.json
+
+import json
+import os
+import platform
+import subprocess
+import time
+from argparse import ArgumentParser
+import numba
+import numpy as np
+from numba import get_num_threads, set_num_threads
+
+from Input import Nodel, Scenario, Solution, synthetic
+from Simulation import Reliability, ReliabilityDual
+from PCapCalculator import PCapTCalc
+from Network import Breakdown, TransmissionCapacity
+from Optimisation import F, F_lean, parallel_object_wrapper
+
+parser = ArgumentParser()
+parser.add_argument('-n', default='Super1', type=str, required=False, help='node=Super1')
+parser.add_argument('-nodes', default=0, type=int, required=False, help='Number of nodes of Super1 to include. 0 includes all')
+parser.add_argument('-sites', default=1, type=int, required=False, help='Multiple of the PV and wind sites of each node')
+parser.add_argument('-years', default=1, type=int, required=False, help='Years of synthetic traces')
+parser.add_argument('-steps', default=1, type=int, required=False, help='Number of steps in capacity expansion')
+parser.add_argument('-popsizes', default='16,64,256', type=str, required=False, help='Comma-separated numbers of candidates per evaluation')
+parser.add_argument('-threads', default='', type=str, required=False, help='Comma-separated numba thread counts. Powers of 2 up to all threads by default')
+parser.add_argument('-repeat', default=5, type=int, required=False, help='Runs of each timing. The fastest is reported')
+parser.add_argument('-seed', default=0, type=int, required=False, help='Seed of the traces and candidates')
+parser.add_argument('-o', default='', type=str, required=False, help='Results file. Results/Benchmark_node(s){n}_steps{steps}.json by default')
+parser.add_argument('-compare', default='', type=str, required=False, help='Earlier results file to compare with')
+
+
+def scenario(node='Super1', nodes=0, sites=1, steps=1):
+    """Scenario with the first nodes of Super1 (all if 0) and sites copies of each PV and wind site"""
+    scenario = Scenario(node=node, steps=steps)
+    if nodes > 0 and 'Super' in node:
+        scenario.coverage = Nodel[:nodes]
+        scenario.Nodel = scenario.coverage
+        scenario.PVl = scenario.PVl[np.in1d(scenario.PVl, scenario.coverage)]
+        scenario.Windl = scenario.Windl[np.in1d(scenario.Windl, scenario.coverage)]
+    scenario.PVl = np.repeat(scenario.PVl, sites)
+    scenario.Windl = np.repeat(scenario.Windl, sites)
+    return scenario
+
+
+def candidates(data, ncand, rng):
+    """Random candidates xs(v, c) of up to 10 GW of each capacity, with storage large enough that most are reliable"""
+    xs = rng.uniform(0, 10, (data.sidx + 1, ncand))
+    xs[data.sidx] = rng.uniform(100, 1000, ncand)
+    return np.asfortranarray(xs) # The layout differential_evolution passes the population in
+
+
+def best(func, repeat):
+    """Fastest of repeat runs of func() in seconds, after a first run to compile it"""
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def kernels(data, x, repeat):
+    """Seconds per call of each kernel of an evaluation of x"""
+    flexible = np.ones(data.intervals, dtype=np.float64) * data.CPeak.sum() * 1000
+    S = Solution(x, data)
+    ReliabilityDual(S, flexible, True) # The trajectories the transmission model takes
+    scratch = (np.empty((2, data.intervals, data.nodes)), np.empty((4, data.intervals))) # Buffers of one thread for F_lean()
+
+    timings = {
+        'Solution': best(lambda: Solution(x, data), repeat),
+        'Reliability': best(lambda: Reliability(Solution(x, data), flexible), repeat),
+        'ReliabilityDual': best(lambda: ReliabilityDual(S, flexible, False), repeat),
+        'PCapTCalc': best(lambda: PCapTCalc(S.CPHP, data.steps, data.intervals), repeat),
+        'F': best(lambda: F(x, data), repeat),
+        'F_lean': best(lambda: F_lean(x, data, flexible, *scratch), repeat),
+    }
+    timings['Reliability'] -= timings['Solution'] # Reliability() overwrites the trajectories, so it gets its own Solution
+
+    if data.nodes > 1:
+        timings['TransmissionCapacity'] = best(lambda: TransmissionCapacity(S, data.DCloss), repeat)
+        timings['Breakdown'] = best(lambda: Breakdown(S.MLoad, S.GPV, S.GWind, S.GBaseload, S.CPHP, S.CPeak, data.steps, flexible, S.Deficit[0],
+                                                      S.Spillage[0], S.Charge[0], S.Discharge[0], S.Storage[0]), repeat)
+    return timings
+
+
+def throughput(data, popsizes, threads, repeat, rng):
+    """Evaluations per second of parallel_object_wrapper (F_parallel with transmission for Super nodes, F_batch
+    otherwise) for each population size and thread count"""
+    results = []
+    for ncand in popsizes:
+        xs = candidates(data, ncand, rng)
+        if not np.isfinite(parallel_object_wrapper(xs, data)).all(): # Would time a path the optimiser never takes
+            raise ValueError("The objective isn't finite for every candidate of the benchmark")
+        for n in threads:
+            set_num_threads(n)
+            seconds = best(lambda: parallel_object_wrapper(xs, data), repeat)
+            results.append({'kernel': 'parallel_object_wrapper', 'popsize': ncand, 'threads': n, 'seconds': seconds, 'evals_per_second': ncand / seconds})
+    return results
+
+
+def machine():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'numba': numba.__version__,
+    }
+
+
+def compare(results, path):
+    """Prints the ratio of each timing to the same timing in an earlier results file (> 1 is slower)"""
+    with open(path) as f:
+        before = json.load(f)
+    if before['config'] != results['config']:
+        print("Warning: {} was run with {}".format(path, before['config']))
+
+    print("Compared with {} (commit {}):".format(path, before['machine']['commit']))
+    for name, seconds in results['kernels'].items():
+        if name in before['kernels']:
+            print("  {:<24} {:>12.6f} s  x{:.2f}".format(name, seconds, seconds / before['kernels'][name]))
+    earlier = {(r['kernel'], r['popsize'], r['threads']): r['seconds'] for r in before['throughput']}
+    for r in results['throughput']:
+        key = (r['kernel'], r['popsize'], r['threads'])
+        if key in earlier:
+            print("  {:<24} p={:<5} t={:<3} {:>8.6f} s  x{:.2f}".format(*key, r['seconds'], r['seconds'] / earlier[key]))
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    maxthreads = get_num_threads()
+    popsizes = [int(p) for p in args.popsizes.split(',')]
+    threads = [int(t) for t in args.threads.split(',')] if args.threads else sorted({min(2 ** i, maxthreads) for i in range(maxthreads.bit_length() + 1)})
+
+    s = scenario(args.n, args.nodes, args.sites, args.steps)
+    data = synthetic(s, intervals=int(args.years * 8760 / 0.5), seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+    config = {'node': args.n, 'nodes': data.nodes, 'pvsites': len(s.PVl), 'windsites': len(s.Windl), 'years': data.years, 'intervals': data.intervals, 'steps': args.steps}
+    print("Benchmark: {nodes} nodes, {pvsites} PV and {windsites} wind sites, {intervals} intervals, {steps} steps".format(**config))
+
+    x = np.ascontiguousarray(candidates(data, 1, rng)[:, 0])
+    results = {
+        'machine': machine(),
+        'config': config,
+        'kernels': kernels(data, x, args.repeat),
+        'throughput': throughput(data, popsizes, threads, args.repeat, rng),
+    }
+    set_num_threads(maxthreads)
+
+    for name, seconds in results['kernels'].items():
+        print("  {:<24} {:>12.6f} s".format(name, seconds))
+    for r in results['throughput']:
+        print("  {kernel:<24} p={popsize:<5} t={threads:<3} {evals_per_second:>10.1f} evals/s".format(**r))
+
+    if args.compare:
+        compare(results, args.compare)
+
+    path = args.o or 'Results/Benchmark_node(s){}_steps{}.json'.format(args.n, args.steps)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+    print("Results written to", path)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
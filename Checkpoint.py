@@ -0,0 +1,61 @@
+# Checkpoints of the differential evolution state for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# A checkpoint holds everything the solver carries from one generation to the next: the population (in the solver's
+# unit scaling), its energies and feasibility, the number of evaluations, the state of the random number generator
+# (and the order it last shuffled the population indices into) and the iteration reached. Restoring it into a solver
+# built with the same settings continues the run exactly as if it had not stopped. Checkpoints are written to a
+# temporary file and renamed into place so a run killed mid-write leaves the previous checkpoint intact.
+#
+# With -surrogate the candidates the model is fitted to are saved as well, as they decide which candidates of the next
+# generation are evaluated.
+
+import json
+import os
+import numpy as np
+
+def save(path, tag, solver, iteration, surrogate=None):
+    tmp = path + '.tmp.npz'
+    model = {'surrogate_X': surrogate.X, 'surrogate_y': surrogate.y} if surrogate is not None else {}
+    np.savez(
+        tmp,
+        population=solver.population,
+        population_energies=solver.population_energies,
+        feasible=solver.feasible,
+        constraint_violation=solver.constraint_violation,
+        nfev=solver._nfev,
+        iteration=iteration,
+        x=solver.x,
+        fun=solver.population_energies[0],
+        rng=json.dumps(solver.random_number_generator.bit_generator.state),
+        index=solver._random_population_index, # Shuffled in place when selecting members to mutate
+        tag=tag,
+        **model,
+    )
+    os.replace(tmp, path)
+
+
+def restore(path, tag, solver, surrogate=None):
+    """Loads a checkpoint into solver (and surrogate). Returns the iteration it was taken at"""
+    with np.load(path) as saved:
+        if str(saved['tag']) != tag or saved['population'].shape != solver.population.shape:
+            raise ValueError("Checkpoint {} was made with another scenario or population size".format(path))
+        if ('surrogate_X' in saved) != (surrogate is not None):
+            raise ValueError("Checkpoint {} was made {} -surrogate".format(path, 'with' if surrogate is None else 'without'))
+
+        solver.population = saved['population'].copy()
+        solver.population_energies = saved['population_energies'].copy()
+        solver.feasible = saved['feasible'].copy()
+        solver.constraint_violation = saved['constraint_violation'].copy()
+        solver._nfev = int(saved['nfev'])
+        solver.random_number_generator.bit_generator.state = json.loads(str(saved['rng']))
+        solver._random_population_index = saved['index'].copy()
+        iteration = int(saved['iteration'])
+        if surrogate is not None:
+            surrogate.X = saved['surrogate_X'].copy()
+            surrogate.y = saved['surrogate_y'].copy()
+
+    print("Resuming from iteration {} of {} (best objective {})".format(iteration, path, solver.population_energies[0]))
+    return iteration
@@ -3,59 +3,187 @@
 # Licensed under the MIT Licence
 # Correspondence: bin.lu@anu.edu.au
 
-from Input import *
-from Simulation import Reliability
-
+# Discription of changes (2025, Owen Chenhall)
+# - Incremental dispatch: each trial resumes the storage recursion from the committed state at the start of the
+#   interval(s) being switched off and stops once the trial has failed or rejoined the committed trajectory,
+#   instead of simulating the whole year for every interval
+# - The parent evaluates the solution once and publishes the net load and storage power capacity in shared memory.
+#   Workers attach to it when the pool starts and receive only (year, offset) items, so the input data are neither
+#   re-read nor pickled per year
+
+import KernelCache # Keys the kernel cache to the sources, before any kernel is defined
+from Input import Scenario
+from Simulation import StorageStep
+from PCapCalculator import PCapTCalc
+
+import numpy as np
 import datetime as dt
-from multiprocessing import Pool, cpu_count
-
-def Flexible(instance):
+import calendar
+from numba import jit
+from multiprocessing import Pool, cpu_count, shared_memory
+
+timestep = 1 # Number of intervals switched off together in each trial
+
+@jit(nopython=True, cache=True)
+def DispatchFlexible(Netload, Pcapacity, Scapacity, Fcapacity, timestep, resolution, efficiency, tolerance=0.1, merge=1e-6):
+    """Switches off the flexible resources one chunk of timestep intervals at a time, keeping each switch-off that
+    leaves the energy deficit of the year within tolerance (MWh). Netload(t) and Pcapacity(t) in MW, Scapacity in MWh.
+    Returns flexible(t) and the resulting Spillage(t), MW
+
+    The committed trajectory (storage and deficit with the switch-offs kept so far) is checkpointed at every interval.
+    A trial at [i, j) only changes the recursion from i onwards, so it starts from the committed storage at i - 1 and
+    adds the committed deficit before i. It is rejected as soon as the deficit exceeds the tolerance, and once it is
+    past j and its storage is within merge (MWh) of the committed storage, the rest of the year is the committed
+    deficit after that interval"""
+
+    length = len(Netload)
+    flexible = Fcapacity * np.ones(length)
+
+    Storage = np.zeros(length)
+    Deficit = np.zeros(length)
+    Storaget_1 = 0.5 * Scapacity
+    for t in range(length):
+        Netloadt = Netload[t] - flexible[t]
+        Discharget, Charget, Storaget_1 = StorageStep(Netloadt, Pcapacity[t], Scapacity, Storaget_1, resolution, efficiency)
+        Storage[t] = Storaget_1
+        Deficit[t] = max(Netloadt - Discharget, 0)
+
+    Suffix = np.zeros(length + 1) # Committed deficit from t to the end of the year, MW
+    for t in range(length - 1, -1, -1):
+        Suffix[t] = Suffix[t+1] + Deficit[t]
+
+    TrialStorage = np.zeros(length)
+    TrialDeficit = np.zeros(length)
+    prefix = 0.0 # Committed deficit before i, MW
+
+    for i in range(0, length, timestep):
+        j = min(i + timestep, length)
+
+        Storaget_1 = Storage[i-1] if i > 0 else 0.5 * Scapacity
+        total = prefix
+        accepted, merged = True, length - 1
+        for t in range(i, length):
+            Netloadt = Netload[t] - (0 if t < j else flexible[t])
+            Discharget, Charget, Storaget_1 = StorageStep(Netloadt, Pcapacity[t], Scapacity, Storaget_1, resolution, efficiency)
+            TrialStorage[t] = Storaget_1
+            TrialDeficit[t] = max(Netloadt - Discharget, 0)
+            total += TrialDeficit[t]
+
+            if total * resolution > tolerance:
+                accepted = False
+                break
+            if t >= j - 1 and abs(Storaget_1 - Storage[t]) <= merge:
+                total += Suffix[t+1]
+                merged = t
+                accepted = total * resolution <= tolerance
+                break
+
+        if accepted:
+            flexible[i:j] = 0
+            Storage[i:merged+1] = TrialStorage[i:merged+1]
+            Deficit[i:merged+1] = TrialDeficit[i:merged+1]
+            for t in range(merged, i - 1, -1):
+                Suffix[t] = Suffix[t+1] + Deficit[t]
+
+        prefix += Deficit[i:j].sum()
+
+    Spillage = np.zeros(length)
+    Storaget_1 = 0.5 * Scapacity
+    for t in range(length):
+        Netloadt = Netload[t] - flexible[t]
+        Discharget, Charget, Storaget_1 = StorageStep(Netloadt, Pcapacity[t], Scapacity, Storaget_1, resolution, efficiency)
+        Spillage[t] = -1 * min(Netloadt + Charget, 0)
+
+    return flexible, Spillage
+
+_shared = {} # Arrays and constants published by the parent, attached in each worker
+
+def publish(arrays):
+    """Copies named arrays into one block of shared memory. Returns the block and the layout workers attach with"""
+    size = sum(a.nbytes for a in arrays.values())
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    layout, offset = [], 0
+    for name, a in arrays.items():
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf, offset=offset)[...] = a
+        layout.append((name, offset, a.shape, a.dtype.str))
+        offset += a.nbytes
+
+    return shm, layout
+
+def attach(shmname, layout, constants):
+    """Pool initializer. Views of the published arrays are read in place, without copying or unpickling"""
+    shm = shared_memory.SharedMemory(name=shmname)
+    _shared['shm'] = shm # Keeps the block mapped for the life of the worker
+    for name, offset, shape, dtype in layout:
+        _shared[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+    _shared.update(constants)
+
+def Flexible(item):
     """Energy source of high flexibility"""
 
-    year, x = instance
+    year, offset = item
     print('Dispatch works on', year)
 
-    S = Solution(x)
-
-    startidx = int((24 / resolution) * (dt.datetime(year, 1, 1) - dt.datetime(firstyear, 1, 1)).days)
-    endidx = int((24 / resolution) * (dt.datetime(year+1, 1, 1) - dt.datetime(firstyear, 1, 1)).days)
+    resolution = _shared['resolution']
+    length = int((24 / resolution) * (dt.datetime(year+1, 1, 1) - dt.datetime(year, 1, 1)).days)
 
-    Fcapacity = CPeak.sum() * pow(10, 3) # GW to MW
-    flexible = Fcapacity * np.ones(endidx - startidx)
+    Netload = _shared['Netload'][offset:offset+length] # Sj-ENLoad(j, t), MW
+    Pcapacity = _shared['Pcapacity'][offset:offset+length] # MW
 
-    for i in range(0, endidx - startidx, timestep):
-        flexible[i: i+timestep] = 0
-        Deficit, DeficitD = Reliability(S, flexible=flexible, start=startidx, end=endidx) # Sj-EDE(t, j), MW
-        if (Deficit + DeficitD).sum() * resolution > 0.1:
-            flexible[i: i+timestep] = Fcapacity
+    flexible, Spillage = DispatchFlexible(Netload, Pcapacity, _shared['Scapacity'], _shared['Fcapacity'], timestep, resolution, _shared['efficiency'])
 
-    flexible = np.clip(flexible - S.Spillage, 0, None)
+    flexible = np.clip(flexible - Spillage, 0, None)
 
-    return flexible
+    return year, flexible
 
-def Analysis(x):
-    """Dispatch.Analysis(result.x)"""
+def Analysis(x, scenario):
+    """Dispatch.Analysis(result.x, scenario)"""
 
+    resolution, firstyear, finalyear = scenario.resolution, scenario.firstyear, scenario.finalyear
     starttime = dt.datetime.now()
     print('Dispatch starts at', starttime)
 
+    # The solution is evaluated once here and only the net load and storage power it implies are shared with workers
+    S = scenario.Solution(x)
+    Netload = S.MLoad.sum(axis=1) - S.GPV.sum(axis=1) - S.GWind.sum(axis=1) - S.GBaseload.sum(axis=1) # Sj-ENLoad(j, t), MW
+    Pcapacity = PCapTCalc(S.CPHP, int(S.steps), S.intervals)[:, 0] # S-CPHP(j), GW to MW
+    constants = {
+        'resolution': resolution,
+        'efficiency': S.efficiency,
+        'Scapacity': S.CPHS * pow(10, 3), # S-CPHS(j), GWh to MWh
+        'Fcapacity': scenario.CPeak.sum() * pow(10, 3), # GW to MW
+    }
+
+    # Work items are (year, offset of its first interval), longest years first so leap years don't finish last
+    years = range(firstyear, finalyear + 1)
+    offsets = [int((24 / resolution) * (dt.datetime(y, 1, 1) - dt.datetime(firstyear, 1, 1)).days) for y in years]
+    items = sorted(zip(years, offsets), key=lambda item: calendar.isleap(item[0]), reverse=True)
+
     # Multiprocessing
-    pool = Pool(processes=min(cpu_count(), finalyear - firstyear + 1))
-    instances = map(lambda y: [y] + [x], range(firstyear, finalyear + 1))
-    Dispresult = pool.map(Flexible, instances)
-    pool.terminate()
+    shm, layout = publish({'Netload': Netload, 'Pcapacity': Pcapacity})
+    try:
+        with Pool(processes=min(cpu_count(), len(items)), initializer=attach, initargs=(shm.name, layout, constants)) as pool:
+            Dispresult = dict(pool.imap_unordered(Flexible, items, chunksize=1))
+    finally:
+        shm.close()
+        shm.unlink()
 
-    Flex = np.concatenate(Dispresult)
-    np.savetxt('Results/Dispatch_Flexible{}.csv'.format(scenario), Flex, fmt='%f', delimiter=',', newline='\n', header='Flexible energy resources')
+    Flex = np.concatenate([Dispresult[y] for y in years])
+    np.savetxt('Results/Dispatch_Flexible{}.csv'.format(scenario.scenario), Flex, fmt='%f', delimiter=',', newline='\n', header='Flexible energy resources')
 
     endtime = dt.datetime.now()
     print('Dispatch took', endtime - starttime)
 
     from Statistics import Information
-    Information(x, Flex)
+    Information(x, Flex, scenario)
 
     return True
 
 if __name__ == '__main__':
+    from Optimisation import parser
+    args = parser.parse_args()
+    scenario = Scenario(node=args.n, steps=args.steps, scenario=args.s)
+
     capacities = np.genfromtxt('Results/Optimisation_resultx.csv', delimiter=',', skip_header=1)
-    Analysis(capacities)
\ No newline at end of file
+    Analysis(capacities, scenario)
\ No newline at end of file
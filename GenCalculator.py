@@ -0,0 +1,32 @@
+# Generation builder for PV and wind under FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+import numpy as np
+import KernelCache # Keys the kernel cache to the sources, before any kernel is defined
+from numba import jit
+
+@jit(nopython=True, cache=True)
+def GenTCalc(TS, C, Aggregation, steps, intervals, Generation=None):
+    """Generation at each node, G(t, j) in MW, from traces TS(t, i) and cumulative capacities C(i) * steps in GW.
+    Aggregation(i, j) maps sites to nodes so each step is a single matrix product TS[step] @ (C[step] * Aggregation).
+    Written into Generation(t, j) if it is given, e.g. a scratch buffer reused between candidates"""
+
+    split = intervals // steps
+    sites = TS.shape[1]
+    if Generation is None:
+        Generation = np.zeros((intervals, Aggregation.shape[1]), dtype=np.float64)
+    else:
+        Generation[steps * split:] = 0
+
+    for i in range(steps):
+        Weights = np.empty_like(Aggregation)
+        for j in range(sites):
+            Weights[j, :] = Aggregation[j, :] * C[i * sites + j] * 1e3 # GW to MW
+
+        start = i * split
+        end = start + split
+        np.dot(TS[start:end], Weights, Generation[start:end])
+
+    return Generation
@@ -7,12 +7,18 @@
 
 # Discription of changes (2025, Owen Chenhall)
 # - Added support capacity expansion under FIRM_CE. Key Changes to solution class sturcture
+# - GPV and GWind are built per node with GenTCalc() instead of tiling capacities per site
+# - Traces are read through a memory-mapped binary cache (InputCache) for only the nodes in coverage
+# - Scenario configuration object with lazily loaded data replaces import-time globals taken from Optimisation
+# - Transmission lines are read from Data/lines.csv and mapped to flows once when the data are built
 
 import numpy as np
-from Optimisation import scenario, node, steps
+from collections import namedtuple
 from numba import float64, int32, types, int64
 from numba.experimental import jitclass
 import BaseGenCalculator
+import InputCache
+from GenCalculator import GenTCalc
 
 # Build limits for capacity in each timestep. Sets upperbound of optimisation
 PVBuildRateLimit = 100    #GW/step
@@ -25,77 +31,187 @@ Nodel = np.array(['FNQ', 'NSW', 'NT', 'QLD', 'SA', 'TAS', 'VIC', 'WA']) #Defines
 PVl =   np.array(['NSW']*7 + ['FNQ']*1 + ['QLD']*2 + ['FNQ']*3 + ['SA']*6 + ['TAS']*0 + ['VIC']*1 + ['WA']*1 + ['NT']*1) #Defines PV sites in scenario. Match to header of PV data input 
 Windl = np.array(['NSW']*8 + ['FNQ']*1 + ['QLD']*2 + ['FNQ']*2 + ['SA']*8 + ['TAS']*4 + ['VIC']*4 + ['WA']*3 + ['NT']*1) #Defines Wind sites in scenario. Match to header of Wind data input
 
-_, Nodel_int = np.unique(Nodel, return_inverse=True)
-_, PVl_int = np.unique(Nodel, return_inverse=True)
-_, Windl_int = np.unique(Nodel, return_inverse=True)
-
-Nodel_int = Nodel_int.astype(np.int32)
-PVl_int = PVl_int.astype(np.int32)
-Windl_int = Windl_int.astype(np.int32)
-
 
 # Time intervals. The time between data points of input data in hours
 resolution = 0.5 
 
 
-#Data import handling
-MLoad = np.genfromtxt('Data/electricity16year.csv', delimiter=',', skip_header=1, usecols=range(4, 4+len(Nodel))) # EOLoad(t, j), MW
-TSPV = np.genfromtxt('Data/pv16year.csv', delimiter=',', skip_header=1, usecols=range(4, 4+len(PVl))) # TSPV(t, i), MW
-TSWind = np.genfromtxt('Data/wind16year.csv', delimiter=',', skip_header=1, usecols=range(4, 4+len(Windl))) # TSWind(t, i), MW
-assets = np.genfromtxt('Data/hydrobio.csv', dtype=None, delimiter=',', encoding=None)[1:, 1:].astype(np.float64)
-basegen = np.genfromtxt('Data/baseload.csv', delimiter=',', skip_header=1, usecols=range(4, 4+len(Nodel)))
-CHydro, CBio = [assets[:, x] * pow(10, -3) for x in range(assets.shape[1])] # CHydro(j), MW to GW
-CBaseload = np.array([0, 0, 0, 0, 0, 0, 0, 0]) # 24/7, GW
-CPeak = CHydro + CBio - CBaseload # GW
+#Defines transmission lines considered in network. Each row of Data/lines.csv is a line (in the order of its costs in
+#Data/factor.csv), the nodes it connects and its length in km. Flows from the first node to the second are positive
+Linesfile = 'Data/lines.csv'
+DClossrate = 0.03 * pow(10, -3) # Fraction of flow lost per km
 
+efficiency = 0.8
 
-#Defines transmission lines considered in network
-# FQ, NQ, NS, NV, AS, SW, only TV constrained
-DCloss = np.array([1500, 1000, 1000, 800, 1200, 2400, 400]) * 0.03 * pow(10, -3)
 
-efficiency = 0.8
-factor = np.genfromtxt('Data/factor.csv', delimiter=',', usecols=1)
+# Arrays and constants of a loaded scenario. Passed to the numba kernels in place of module globals
+ScenarioData = namedtuple('ScenarioData', [
+    'node', 'steps', 'intervals', 'nodes', 'years', 'firstyear', 'finalyear',
+    'pzones', 'wzones', 'pidx', 'widx', 'sidx',
+    'resolution', 'efficiency', 'energy',
+    'MLoad', 'TSPV', 'TSWind', 'GBaseload', 'MLoad_sum', 'GBaseload_sum', 'weights',
+    'PVnode', 'Windnode', 'Flowmap', 'Nodel_int', 'PVl_int', 'Windl_int',
+    'CHydro', 'CBio', 'CBaseload', 'CPeak', 'contingency', 'DCloss', 'factor',
+])
 
+_loaded = {} # ScenarioData shared by scenarios with the same key
 
-if node == 'Super1': #Defult option
-    coverage = Nodel
-else:
-    coverage = np.array([node]) # For single node optimisations
 
-# Adjust data inports to match scenario (changes which nodes are considered)
-MLoad = MLoad[:, np.where(np.in1d(Nodel, coverage)==True)[0]]
-TSPV = TSPV[:, np.where(np.in1d(PVl, coverage)==True)[0]]
-TSWind = TSWind[:, np.where(np.in1d(Windl, coverage)==True)[0]]
-basegen = basegen[:, np.where(np.in1d(Nodel, coverage)==True)[0]]
+class Scenario:
+    """Configuration of an optimisation scenario. Input data are only loaded on first use of data (or any of its
+    fields, e.g. scenario.intervals) and are shared with other scenarios of the same node(s), steps and demand growth"""
 
-CHydro, CBio, CBaseload, CPeak = [x[np.where(np.in1d(Nodel, coverage)==True)[0]] for x in (CHydro, CBio, CBaseload, CPeak)]
+    def __init__(self, node='Super1', steps=1, scenario=1, demandgrowth=DemandGrowth, pvlimit=PVBuildRateLimit, windlimit=WindBuildRateLimit):
+        self.node = node
+        self.steps = steps
+        self.scenario = scenario
+        self.demandgrowth = demandgrowth
+        self.pvlimit = pvlimit
+        self.windlimit = windlimit
+
+        if node == 'Super1': #Defult option
+            self.coverage = Nodel
+        else:
+            self.coverage = np.array([node]) # For single node optimisations
 
-Nodel_int, PVl_int, Windl_int = [x[np.where(Nodel==node)[0]] for x in (Nodel_int, PVl_int, Windl_int)]
-Nodel, PVl, Windl = [x[np.where(x==node)[0]] for x in (Nodel, PVl, Windl)]
+        self.Nodel = Nodel[np.where(np.in1d(Nodel, self.coverage)==True)[0]]
+        self.PVl = PVl[np.where(np.in1d(PVl, self.coverage)==True)[0]]
+        self.Windl = Windl[np.where(np.in1d(Windl, self.coverage)==True)[0]]
 
+    def key(self):
+        return (self.node, self.steps, self.demandgrowth)
+
+    @property
+    def data(self):
+        if self.key() not in _loaded:
+            _loaded[self.key()] = load(self)
+        return _loaded[self.key()]
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in ScenarioData._fields:
+            raise AttributeError(name)
+        return getattr(self.data, name)
+
+    def Solution(self, x):
+        """Solution factory for this scenario"""
+        return Solution(np.asarray(x, dtype=np.float64), self.data)
+
+    def bounds(self):
+        """Lower and upper bounds of the decision variables"""
+        pzones, wzones, nodes, steps = self.pzones, self.wzones, self.nodes, self.steps
+        lb = [0.]  * pzones + [0.] * wzones + [0.] *  (nodes * steps) + [0.]
+        ub = [self.pvlimit] * pzones + [self.windlimit]  * wzones + [50.] *  nodes + [50.] * (nodes * (steps - 1)) + [5000.]
+        return lb, ub
+
+
+def load(scenario):
+    """Reads the input data for a scenario. Only the columns of nodes and sites in coverage are read"""
+    coverage = scenario.coverage
+
+    #Data import handling
+    MLoad = InputCache.load('Data/electricity16year.csv', usecols=4 + np.where(np.in1d(Nodel, coverage)==True)[0]) # EOLoad(t, j), MW
+    TSPV = InputCache.load('Data/pv16year.csv', usecols=4 + np.where(np.in1d(PVl, coverage)==True)[0]) # TSPV(t, i), MW
+    TSWind = InputCache.load('Data/wind16year.csv', usecols=4 + np.where(np.in1d(Windl, coverage)==True)[0]) # TSWind(t, i), MW
+    Year = InputCache.load('Data/electricity16year.csv', usecols=[0])[:, 0]
+    assets = np.genfromtxt('Data/hydrobio.csv', dtype=None, delimiter=',', encoding=None)[1:, 1:].astype(np.float64)
+    factor = np.genfromtxt('Data/factor.csv', delimiter=',', usecols=1)
+
+    return build(scenario, MLoad, TSPV, TSWind, assets, factor, int(Year[0]), int(Year[-1]))
+
+
+def synthetic(scenario, intervals=17520, seed=0):
+    """ScenarioData of random traces with the nodes and sites of a scenario. Has the same types as load() so kernels
+    compiled against it are reused for the real data"""
+    rng = np.random.default_rng(seed)
+    intervals = intervals // scenario.steps * scenario.steps
+    hours = np.arange(intervals) * resolution % 24
+
+    MLoad = 1000 * (1 + 0.3 * np.sin(2 * np.pi * hours / 24))[:, None] * rng.uniform(0.8, 1.2, (intervals, len(scenario.Nodel))) # MW
+    TSPV = np.clip(np.sin(np.pi * (hours - 6) / 12), 0, None)[:, None] * rng.uniform(0.5, 1, (intervals, len(scenario.PVl)))
+    TSWind = rng.uniform(0, 1, (intervals, len(scenario.Windl)))
+    assets = np.zeros((len(Nodel), 2))
+    factor = np.genfromtxt('Data/factor.csv', delimiter=',', usecols=1)
+
+    return build(scenario, MLoad, TSPV, TSWind, assets, factor, 2000, 2000 + int(resolution * intervals / 8760) - 1)
 
-# Apply load multiplier
-MLoad_split = int(len(MLoad)/steps)
-for i in range(steps):
-    if i == 0:
-        MLoad[MLoad_split*i:MLoad_split*(i+1)] = MLoad[MLoad_split*i:MLoad_split*(i+1)]
-    else:
-        MLoad[MLoad_split*i:MLoad_split*(i+1)] = MLoad[MLoad_split*i:MLoad_split*(i+1)] * (DemandGrowth ** i)
-    
 
-intervals, nodes = MLoad.shape
-years = int(resolution * intervals / 8760)
-pzones, wzones = (TSPV.shape[1] * steps, TSWind.shape[1] * steps)
+def network(nodes, path=Linesfile):
+    """Flowmap(j, k) mapping net imports of the nodes to flows on each line, and the losses DCloss(k) of each line.
+    Lines without both ends in nodes carry no flow.
 
+    The incidence matrix A(j, k) is -1 at the node a line leaves and +1 at the node it enters, so MImport = A . TDC.
+    On a radial (tree) network A has full column rank and its pseudo-inverse gives the unique flows of balanced
+    imports; on a meshed network it gives the flows of least magnitude. Imports that don't balance would instead be
+    fitted by least squares, so Network.NodalImport() apportions system-wide baseload to the nodes"""
+    lines = np.genfromtxt(path, dtype=None, delimiter=',', encoding=None, skip_header=1, ndmin=1)
+    names, From, To = [np.array([line[x] for line in lines]) for x in range(3)]
+    Length = np.array([line[3] for line in lines], dtype=np.float64)
 
-pidx, widx, sidx = (pzones, pzones + wzones, pzones + wzones + (nodes * steps))
+    Incidence = np.zeros((len(nodes), len(lines)))
+    for k in range(len(lines)):
+        if From[k] in nodes and To[k] in nodes:
+            Incidence[np.where(nodes == From[k])[0][0], k] = -1
+            Incidence[np.where(nodes == To[k])[0][0], k] = 1
 
+    Flowmap = np.ascontiguousarray(np.linalg.pinv(Incidence).T)
+    DCloss = Length * DClossrate
 
-energy = MLoad.sum() * pow(10, -9) * resolution / years # PWh p.a.
-contingency = list(0.25 * MLoad.max(axis=0) * pow(10, -3)) # MW to GW
+    return Flowmap, DCloss
 
-GBaseload = BaseGenCalculator.tileBaseGen(steps, intervals)
-#GBaseload = np.tile(CBaseload, (intervals, 1)) * pow(10, 3) # GW to MW # Used if importing base generation from CSV
+
+def build(scenario, MLoad, TSPV, TSWind, assets, factor, firstyear, finalyear):
+    """ScenarioData from traces of the nodes and sites in coverage"""
+    coverage, steps = scenario.coverage, scenario.steps
+
+    CHydro, CBio = [assets[:, x] * pow(10, -3) for x in range(assets.shape[1])] # CHydro(j), MW to GW
+    CBaseload = np.array([0, 0, 0, 0, 0, 0, 0, 0], dtype=np.float64) # 24/7, GW
+    CPeak = CHydro + CBio - CBaseload # GW
+
+    # Adjust data inports to match scenario (changes which nodes are considered)
+    CHydro, CBio, CBaseload, CPeak = [x[np.where(np.in1d(Nodel, coverage)==True)[0]] for x in (CHydro, CBio, CBaseload, CPeak)]
+
+    # Site to node aggregation of PV and wind traces, PVnode(i, j) and Windnode(i, j)
+    PVnode = (scenario.PVl[:, None] == coverage[None, :]).astype(np.float64)
+    Windnode = (scenario.Windl[:, None] == coverage[None, :]).astype(np.float64)
+
+    # Flows of each line from the net imports of the nodes in coverage, TDC(t, k) = MImport(t, j) . Flowmap(j, k)
+    Flowmap, DCloss = network(scenario.Nodel)
+
+    # Node indices in ['FNQ', 'NSW', 'NT', 'QLD', 'SA', 'TAS', 'VIC', 'WA'] of the nodes and sites in coverage
+    Nodel_int, PVl_int, Windl_int = [np.searchsorted(Nodel, x).astype(np.int32) for x in (scenario.Nodel, scenario.PVl, scenario.Windl)]
+
+    # Apply load multiplier. The cached load is shared between processes so it is copied only when it changes
+    if scenario.demandgrowth != 1:
+        MLoad = np.array(MLoad)
+        MLoad_split = int(len(MLoad)/steps)
+        for i in range(1, steps):
+            MLoad[MLoad_split*i:MLoad_split*(i+1)] = MLoad[MLoad_split*i:MLoad_split*(i+1)] * (scenario.demandgrowth ** i)
+
+    intervals, nodes = MLoad.shape
+    years = int(resolution * intervals / 8760)
+    pzones, wzones = (TSPV.shape[1] * steps, TSWind.shape[1] * steps)
+
+    pidx, widx, sidx = (pzones, pzones + wzones, pzones + wzones + (nodes * steps))
+
+    energy = MLoad.sum() * pow(10, -9) * resolution / years # PWh p.a.
+    contingency = 0.25 * MLoad.max(axis=0) * pow(10, -3) # MW to GW
+
+    GBaseload = BaseGenCalculator.tileBaseGen(steps, intervals)
+    #GBaseload = np.tile(CBaseload, (intervals, 1)) * pow(10, 3) # GW to MW # Used if importing base generation from CSV
+
+    # Traces summed across nodes for the population-batched objective
+    MLoad_sum = MLoad.sum(axis=1) # MW
+    GBaseload_sum = GBaseload.sum(axis=1) # MW
+    weights = np.ones(intervals, dtype=np.float64) # Each interval represents itself at full resolution
+
+    return ScenarioData(
+        node=scenario.node, steps=steps, intervals=intervals, nodes=nodes, years=years, firstyear=firstyear, finalyear=finalyear,
+        pzones=pzones, wzones=wzones, pidx=pidx, widx=widx, sidx=sidx,
+        resolution=resolution, efficiency=efficiency, energy=energy,
+        MLoad=MLoad, TSPV=TSPV, TSWind=TSWind, GBaseload=GBaseload, MLoad_sum=MLoad_sum, GBaseload_sum=GBaseload_sum, weights=weights,
+        PVnode=PVnode, Windnode=Windnode, Flowmap=Flowmap, Nodel_int=Nodel_int, PVl_int=PVl_int, Windl_int=Windl_int,
+        CHydro=CHydro, CBio=CBio, CBaseload=CBaseload, CPeak=CPeak, contingency=contingency, DCloss=DCloss, factor=factor,
+    )
 
 
 # Specify the types for jitclass
@@ -108,8 +224,9 @@ solution_spec = [
     ('resolution',float64),
     ('CPV', float64[:]),
     ('CWind', float64[:]),
-    ('GPV', float64[:, :]),  # 2D array of floats
-    ('GWind', float64[:, :]),  # 2D array of floats
+    ('GPV', float64[:, :]),  # GPV(t, j), per node
+    ('GWind', float64[:, :]),  # GWind(t, j), per node
+    ('Flowmap', float64[:, ::1]),  # Flowmap(j, k), net imports of nodes to line flows
     ('CPHP', float64[:]),
     ('CPHS', float64),
     ('efficiency', float64),
@@ -134,17 +251,21 @@ solution_spec = [
 ]
 
 
+
 @jitclass(solution_spec)
 class Solution:
     #A candidate solution of decision variables (CPV(i), CWind(j), CPHP(k)) * steps, S-CPHS(l)
     
-    def __init__(self, x):
+    def __init__(self, x, data):
+        steps, intervals = data.steps, data.intervals
+        pidx, widx, sidx = data.pidx, data.widx, data.sidx
+
         self.steps = steps
         self.x = x
-        self.MLoad = MLoad
+        self.MLoad = data.MLoad
         self.intervals = intervals
-        self.nodes = nodes
-        self.resolution = resolution
+        self.nodes = data.nodes
+        self.resolution = data.resolution
 
 
         self.CPV = self.x[: pidx].copy()  # CPV(i), GW
@@ -170,31 +291,17 @@ class Solution:
             self.CPHP[CPHP_split*i:CPHP_split*(i+1)] = self.CPHP[CPHP_split*i:CPHP_split*(i+1)] + self.CPHP[CPHP_split*(i-1):CPHP_split*(i)]
 
 
-        # Manually replicating np.tile functionality for CPV and CWind
-        CPV_tiled = np.zeros((intervals, CPV_split))
-        CWind_tiled = np.zeros((intervals, CWind_split))
+        self.GPV = GenTCalc(data.TSPV, self.CPV, data.PVnode, steps, intervals)  # GPV(t, j), GW to MW
+        self.GWind = GenTCalc(data.TSWind, self.CWind, data.Windnode, steps, intervals)  # GWind(t, j), GW to MW
         
-        intervals_per_step = intervals/steps
-        for i in range(intervals):
-            step_idx = i // intervals_per_step  # which segment to use
-            for j in range(CPV_split):
-                CPV_tiled[i, j] = self.CPV[int(j + (step_idx * CPV_split))]
-            for j in range(CWind_split):
-                CWind_tiled[i, j] = self.CWind[int(j + (step_idx * CWind_split))]
-            """ for j in range(len(self.CInter)):
-                CInter_tiled[i, j] = self.CInter[j] """
-
-
-        self.GPV = TSPV * CPV_tiled * 1000  # GPV(i, t), GW to MW
-        self.GWind = TSWind * CWind_tiled * 1000  # GWind(i, t), GW to MW
-        
-        self.efficiency = efficiency
+        self.efficiency = data.efficiency
 
-        self.Nodel_int = Nodel_int
-        self.PVl_int = PVl_int
-        self.Windl_int = Windl_int
-        self.node = node
+        self.Flowmap = data.Flowmap
+        self.Nodel_int = data.Nodel_int
+        self.PVl_int = data.PVl_int
+        self.Windl_int = data.Windl_int
+        self.node = data.node
 
-        self.GBaseload = GBaseload
-        self.CPeak = CPeak
-        self.CHydro = CHydro
+        self.GBaseload = data.GBaseload
+        self.CPeak = data.CPeak
+        self.CHydro = data.CHydro
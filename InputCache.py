@@ -0,0 +1,62 @@
+# Binary cache of CSV input data for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# Parsing the multi-year traces with np.genfromtxt is slow and every process importing Input would hold its own copy.
+# Parsed columns are saved once as .npy, keyed by a hash of the source file and the column selection, and opened
+# copy-on-write with mmap so that processes share the same pages (and numba sees ordinary writeable arrays). A cache
+# entry is rebuilt whenever the CSV changes.
+
+import hashlib
+import json
+import os
+import numpy as np
+
+cachedir = 'Data/cache'
+
+def file_hash(path):
+    """SHA-1 of the file contents. Hashes are remembered by size and modification time to avoid re-reading the file"""
+    stat = os.stat(path)
+    stamp = '{}:{}'.format(stat.st_size, stat.st_mtime_ns)
+    indexpath = os.path.join(cachedir, 'index.json')
+
+    try:
+        with open(indexpath) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    entry = index.get(os.path.abspath(path))
+    if entry is not None and entry['stamp'] == stamp:
+        return entry['hash']
+
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            sha.update(block)
+
+    index[os.path.abspath(path)] = {'stamp': stamp, 'hash': sha.hexdigest()}
+    temp = '{}.{}'.format(indexpath, os.getpid())
+    with open(temp, 'w') as f:
+        json.dump(index, f)
+    os.replace(temp, indexpath)
+
+    return sha.hexdigest()
+
+
+def load(path, usecols, skip_header=1):
+    """Columns usecols of the CSV at path as a copy-on-write memory-mapped float64 array (t, i)"""
+    os.makedirs(cachedir, exist_ok=True)
+    usecols = [int(i) for i in usecols]
+
+    key = hashlib.sha1('{}|{}|{}'.format(file_hash(path), usecols, skip_header).encode()).hexdigest()[:16]
+    cachepath = os.path.join(cachedir, '{}_{}.npy'.format(os.path.splitext(os.path.basename(path))[0], key))
+
+    if not os.path.exists(cachepath):
+        data = np.genfromtxt(path, delimiter=',', skip_header=skip_header, usecols=usecols, ndmin=2)
+        temp = '{}.{}.npy'.format(cachepath[:-4], os.getpid())
+        np.save(temp, np.ascontiguousarray(data, dtype=np.float64))
+        os.replace(temp, cachepath)
+
+    return np.load(cachepath, mmap_mode='c')
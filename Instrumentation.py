@@ -0,0 +1,124 @@
+# Hot-path instrumentation for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# The objective kernels take an optional counters(thread, column) array. Each stage of an evaluation reads the CPU's
+# cycle counter (llvm.readcyclecounter) before and after and adds the difference to the row of the numba thread it ran
+# on, so threads of a prange never write the same element and the rows are summed afterwards. Without counters the
+# argument is omitted, numba prunes every `if counters is not None` branch when it compiles the kernel, and the
+# uninstrumented kernel is the same machine code as before.
+#
+# Profile wraps the instrumented kernel as the vectorised objective. Once per generation it reports evaluations per
+# second, the share of each stage and the parallel efficiency: the cycles the threads spent evaluating candidates over
+# the cycles of the wall time of the parallel calls times the number of threads.
+
+import csv
+import time
+import numpy as np
+from llvmlite import ir
+import KernelCache # Keys the kernel cache to the sources, before any kernel is defined
+from numba import config, get_num_threads, get_thread_id, jit, types
+from numba.core import cgutils
+from numba.extending import intrinsic
+
+# Columns of counters. BUSY is the whole evaluation of a candidate, only counted where candidates run in parallel
+SOLUTION, RELIABILITY, TRANSMISSION, COST, BUSY, EVALUATIONS = range(6)
+stages = ('Solution', 'Reliability', 'Transmission', 'Cost')
+
+@intrinsic
+def cycles(typingctx):
+    """CPU cycle counter. Only meaningful as a difference on the same thread"""
+    def codegen(context, builder, signature, args):
+        fn = cgutils.get_or_insert_function(builder.module, ir.FunctionType(ir.IntType(64), []), 'llvm.readcyclecounter')
+        return builder.call(fn, [])
+    return types.int64(), codegen
+
+
+@jit(nopython=True, cache=True)
+def lap(counters, column, start):
+    """Adds the cycles since start to column of this thread. Returns the cycle count to time the next stage from"""
+    now = cycles()
+    counters[get_thread_id(), column] += now - start
+    return now
+
+
+@jit(nopython=True, cache=True)
+def now():
+    return cycles()
+
+
+def counters():
+    return np.zeros((config.NUMBA_NUM_THREADS, EVALUATIONS + 1), dtype=np.int64)
+
+
+def frequency(seconds=0.05):
+    """Cycles per second of the cycle counter"""
+    now()
+    start, tick = time.perf_counter(), now()
+    while time.perf_counter() - start < seconds:
+        pass
+    return (now() - tick) / (time.perf_counter() - start)
+
+
+class Profile:
+    """Vectorised objective evaluating kernel(xs, counters) and reporting the counters once per generation.
+    Rows are written to path (CSV) once it is opened, e.g. alongside the iteration log"""
+
+    def __init__(self, kernel, disp=True):
+        self.kernel = kernel
+        self.disp = disp
+        self.counters = counters()
+        self.frequency = frequency()
+        self.file, self.writer = None, None
+
+        self.wall = 0 # Cycles in kernel
+        self.threads = 0 # Cycles in kernel times the threads available to it
+        self.generation = 0
+        self.last = (self.counters.copy(), 0, 0, time.perf_counter())
+
+    def open(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['Generation', 'Evaluations', 'Seconds', 'Evaluations/s', 'Kernel share'] + ['{} share'.format(s) for s in stages] + ['Parallel efficiency'])
+
+    def __call__(self, xs):
+        start = now()
+        result = self.kernel(xs, self.counters)
+        elapsed = now() - start
+        self.wall += elapsed
+        self.threads += elapsed * get_num_threads()
+        return result
+
+    def breakdown(self, counters, wall, threads, seconds):
+        """Evaluations, evaluations per second, share of the wall time in the kernel, share of each stage in the
+        staged cycles and parallel efficiency (nan where candidates are not evaluated in parallel)"""
+        totals = counters.sum(axis=0)
+        evaluations = int(totals[EVALUATIONS])
+        staged = totals[:len(stages)].sum()
+        shares = totals[:len(stages)] / staged if staged else np.zeros(len(stages))
+        efficiency = totals[BUSY] / threads if totals[BUSY] and threads else np.nan
+        kernel = wall / self.frequency / seconds if seconds else np.nan
+        return evaluations, evaluations / seconds if seconds else np.nan, kernel, shares, efficiency
+
+    def update(self, population_energies):
+        """Called once per generation. Reports the counters since the previous generation"""
+        self.generation += 1
+        counters, wall, threads, start = self.last
+        self.last = (self.counters.copy(), self.wall, self.threads, time.perf_counter())
+        seconds = self.last[3] - start
+
+        evaluations, rate, kernel, shares, efficiency = self.breakdown(self.counters - counters, self.wall - wall, self.threads - threads, seconds)
+        if self.writer is not None:
+            self.writer.writerow([self.generation, evaluations, seconds, rate, kernel] + list(shares) + [efficiency])
+            self.file.flush()
+        if self.disp:
+            print("Profile: {:.1f} evaluations/s, ".format(rate) + ", ".join("{} {:.0%}".format(s, share) for s, share in zip(stages, shares)) + ", parallel efficiency {:.0%}".format(efficiency))
+
+    def report(self):
+        seconds = self.wall / self.frequency
+        evaluations, rate, kernel, shares, efficiency = self.breakdown(self.counters, self.wall, self.threads, seconds)
+        print("Profile: {} evaluations in {:.1f} s of the objective ({:.1f}/s)".format(evaluations, seconds, rate))
+        print("Profile: " + ", ".join("{} {:.1%}".format(s, share) for s, share in zip(stages, shares)) + ", parallel efficiency {:.1%}".format(efficiency))
+        if self.file is not None:
+            self.file.close()
@@ -0,0 +1,149 @@
+# Island-model differential evolution for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# Each island is a separate process evolving its own population with the (numba-parallel) objective on a share of the
+# cores. The input data are opened from the memory-mapped InputCache, so islands share the same pages rather than
+# holding a copy each. Every migration interval the islands send their best members to the coordinator over a pipe,
+# which routes them to other islands by the topology, where they replace the worst members they improve on.
+#
+# Topologies: 'ring' sends the migrants of island i to island i + 1. 'full' offers every island the best migrants of
+# all the others.
+
+import datetime as dt
+import multiprocessing as mp
+import numpy as np
+from numba import get_num_threads, set_num_threads
+from scipy.optimize import OptimizeResult
+from scipy.optimize._differentialevolution import DifferentialEvolutionSolver
+
+from Input import Scenario
+from Optimisers import Counter
+
+def immigrate(solver, x, energies):
+    """Replaces the worst members of the population with the migrants that are better than them"""
+    worst = np.argsort(solver.population_energies)[::-1][:len(energies)]
+    for w, xi, energy in zip(worst, x[np.argsort(energies)], np.sort(energies)):
+        if energy < solver.population_energies[w]:
+            solver.population[w] = solver._unscale_parameters(xi)
+            solver.population_energies[w] = energy
+    solver._promote_lowest_energy()
+
+
+def island(conn, args, index, seed, threads, x0):
+    """Island process. Receives (generations, migrants) and replies with its best args.migrants members, until None"""
+    from Optimisation import objective
+
+    set_num_threads(threads)
+    scenario = Scenario(node=args.n, steps=args.steps, scenario=args.s)
+    args.memofile = '' # Islands don't share a cache file
+    func, screens, cache, reduced, tag = objective(args, scenario)
+    func = Counter(func)
+    lb, ub = scenario.bounds()
+
+    with DifferentialEvolutionSolver(
+        x0=x0,
+        func=func,
+        bounds=list(zip(lb, ub)),
+        tol=0,
+        maxiter=args.i,
+        popsize=args.p,
+        mutation=(0.2, args.m),
+        recombination=args.r,
+        rng=np.random.default_rng(seed),
+        polish=False,
+        updating='deferred',
+        workers=1,
+        vectorized=True,
+        ) as solver:
+
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+
+            generations, (x, energies) = message
+            if len(energies):
+                immigrate(solver, x, energies)
+
+            for _ in range(generations):
+                next(solver)
+                for screen in screens:
+                    screen.update(solver.population_energies)
+
+            best = np.argsort(solver.population_energies)[:args.migrants]
+            conn.send((solver._scale_parameters(solver.population[best]), solver.population_energies[best], func.nfev))
+
+    print("Island", index)
+    for screen in screens:
+        screen.report()
+    if cache is not None:
+        cache.report()
+    conn.close()
+
+
+def route(emigrants, topology):
+    """Migrants (x, energies) received by each island"""
+    n = len(emigrants)
+    if topology == 'ring':
+        return [emigrants[(i - 1) % n] for i in range(n)]
+
+    immigrants = []
+    for i in range(n):
+        x = np.concatenate([emigrants[j][0] for j in range(n) if j != i])
+        energies = np.concatenate([emigrants[j][1] for j in range(n) if j != i])
+        best = np.argsort(energies)[:len(emigrants[i][1])]
+        immigrants.append((x[best], energies[best]))
+    return immigrants
+
+
+def run(args, x0, log, starttime):
+    """Optimises on args.w islands of args.p * (number of variables) members each, migrating every args.migrate
+    generations. Progress is logged once per migration interval"""
+    islands = args.w
+    threads = max(1, get_num_threads() // islands)
+    seeds = np.random.SeedSequence(args.seed).spawn(islands)
+
+    # Spawned rather than forked: the parent has already started numba's thread pool
+    context = mp.get_context('spawn')
+    conns, processes = [], []
+    for i in range(islands):
+        conn, child = context.Pipe()
+        process = context.Process(target=island, args=(child, args, i, seeds[i], threads, x0 if i == 0 else None), daemon=True)
+        process.start()
+        child.close()
+        conns.append(conn)
+        processes.append(process)
+    print("Islands: {} processes of {} threads, migrating {} members every {} generations ({})".format(islands, threads, args.migrants, args.migrate, args.topology))
+
+    none = (np.zeros((0, 0)), np.zeros(0))
+    immigrants = [none] * islands
+    generation, nfev, x, fun = 0, 0, None, np.inf
+    try:
+        while generation < args.i:
+            generations = min(args.migrate, args.i - generation)
+            for conn, migrants in zip(conns, immigrants):
+                conn.send((generations, migrants))
+            replies = [conn.recv() for conn in conns]
+            emigrants = [reply[:2] for reply in replies]
+            nfev = sum(reply[2] for reply in replies)
+            generation += generations
+
+            for xs, energies in emigrants:
+                if energies[0] < fun:
+                    x, fun = xs[0], energies[0]
+            print("Islands: generation {} f(x)= {}".format(generation, fun))
+            log.append(generation, nfev, (dt.datetime.now() - starttime).total_seconds(), fun, x)
+
+            immigrants = route(emigrants, args.topology)
+    finally:
+        for conn in conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in processes:
+            process.join()
+
+    return OptimizeResult(x=x, fun=fun, nit=generation, nfev=nfev)
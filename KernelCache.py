@@ -0,0 +1,52 @@
+# On-disk cache of the compiled kernels for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# Numba decides whether a cached kernel is stale from the modification time of the file it is defined in only. Kernels
+# inline their callees from other modules (F calls ReliabilityLean, LineCapacity, GenTCalc, PCapSteps, ...), so after
+# editing one of those the cached F would still run the old code. Importing this module points numba's cache
+# (NUMBA_CACHE_DIR) at a directory keyed by a hash of every module that defines or is inlined into a cached kernel, so
+# editing any of them compiles everything afresh. Caches of earlier sources are removed.
+#
+# Every module defining a cached kernel imports this before its first kernel, as numba fixes the cache directory of a
+# kernel when it is defined. NUMBA_CACHE_DIR is inherited by worker processes, which reuse the same directory. A
+# NUMBA_CACHE_DIR set by the user is kept as the parent directory of the keyed one.
+
+import hashlib
+import os
+import shutil
+from numba.core import config
+
+sources = ('Input.py', 'Simulation.py', 'Network.py', 'PCapCalculator.py', 'GenCalculator.py', 'Instrumentation.py',
+           'Optimisation.py', 'Dispatch.py')
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def source_hash():
+    """SHA-1 of the kernel sources, shortened"""
+    sha = hashlib.sha1()
+    for name in sources:
+        sha.update(name.encode())
+        with open(os.path.join(directory, name), 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:16]
+
+def keyed(path):
+    """Whether path is a cache directory keyed by source_hash(), e.g. inherited from the parent process"""
+    name = os.path.basename(os.path.normpath(path))
+    return len(name) == 16 and all(c in '0123456789abcdef' for c in name)
+
+default = os.path.join(directory, '__pycache__', 'kernels')
+key = source_hash()
+cachedir = os.environ.get('NUMBA_CACHE_DIR', '')
+if os.path.basename(os.path.normpath(cachedir)) != key:
+    parent = os.path.dirname(os.path.normpath(cachedir)) if keyed(cachedir) else cachedir or default
+    cachedir = os.path.join(parent, key)
+    os.environ['NUMBA_CACHE_DIR'] = cachedir
+    config.reload_config()
+
+    # Stale caches are only removed from the default directory, never from a NUMBA_CACHE_DIR the user set
+    if parent == default and os.path.isdir(parent):
+        for stale in os.listdir(parent):
+            if stale != key:
+                shutil.rmtree(os.path.join(parent, stale), ignore_errors=True)
@@ -0,0 +1,90 @@
+# Evaluation cache of the objective function for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# Differential evolution proposes duplicate candidates, particularly once the population has converged and when trial
+# vectors are clipped to the bounds. Candidates are keyed by their capacities rounded to a multiple of tolerance so
+# that candidates within the tolerance of an evaluated one reuse its objective. The least recently used entries are
+# evicted beyond size. A cache saved to path is reused by a later run with the same tag (scenario and objective).
+
+import os
+from collections import OrderedDict
+import numpy as np
+
+class EvaluationCache:
+    """Vectorised objective with memoisation. func maps a population xs(v, c) to an objective vector"""
+
+    def __init__(self, func, tolerance=1e-6, size=10000, path=None, tag=''):
+        self.func = func
+        self.tolerance = tolerance
+        self.size = size
+        self.path = path
+        self.tag = tag
+        self.entries = OrderedDict() # Key of a candidate to its objective, least recently used first
+
+        self.hits = 0
+        self.misses = 0
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def key(self, x):
+        if self.tolerance > 0:
+            return np.floor(x / self.tolerance + 0.5).astype(np.int64).tobytes()
+        return np.asarray(x, dtype=np.float64).tobytes()
+
+    def __call__(self, xs):
+        keys = [self.key(xs[:, i]) for i in range(xs.shape[1])]
+        result = np.empty(len(keys), dtype=np.float64)
+
+        # Candidates not in the cache, each evaluated once even if repeated in the population
+        missing = OrderedDict()
+        for i, key in enumerate(keys):
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                result[i] = self.entries[key]
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            columns = [i[0] for i in missing.values()]
+            values = self.func(np.ascontiguousarray(xs[:, columns]))
+            for (key, i), value in zip(missing.items(), values):
+                result[i] = value
+                self.store(key, value)
+
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        return result
+
+    def store(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def save(self, path=None):
+        """Saves the entries, least recently used first. Written to a temporary file and renamed into place"""
+        path = path or self.path
+        keys = np.array([np.frombuffer(key, dtype=np.uint8) for key in self.entries.keys()], dtype=np.uint8)
+        values = np.fromiter(self.entries.values(), dtype=np.float64, count=len(self.entries))
+
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, keys=keys, values=values, tolerance=self.tolerance, tag=self.tag)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """Adds the entries of a saved cache. Ignored if it was made with another tolerance or tag"""
+        with np.load(path) as saved:
+            if float(saved['tolerance']) != self.tolerance or str(saved['tag']) != self.tag:
+                print("Evaluation cache {} is for another scenario or tolerance and is not used".format(path))
+                return
+            for key, value in zip(saved['keys'], saved['values']):
+                self.store(key.tobytes(), float(value))
+        print("Evaluation cache: {} entries loaded from {}".format(len(self.entries), path))
+
+    def report(self):
+        calls = self.hits + self.misses
+        rate = self.hits / calls if calls else 0
+        print("Evaluation cache: {} hits and {} misses of {} candidates ({:.1%} reused)".format(self.hits, self.misses, calls, rate))
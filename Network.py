@@ -7,58 +7,126 @@
 
 # Discription of changes (2025, Owen Chenhall)
 # - Added support capacity expansion under FIRM_CE
+# - Generation is aggregated to nodes when the Solution is built
+# - Line flows of all intervals in one product with the flow map of the lines in Data/lines.csv, in place of the
+#   hard-coded FQ, NQ, NS, NV, AS, SW and TV expressions
+# - TransmissionCapacity() streams the line capacities and losses for the objective
+# - Baseload given as one system-wide column is apportioned to the nodes by their share of load, so that the net
+#   imports of the nodes balance
+# - LineCapacity() takes the arrays of TransmissionCapacity() in place of a Solution, for the lean objective
+# - Transmission() is replaced by NodalImport(), the breakdown to nodes of a span of intervals with the storage power
+#   shares of its step, which both the line capacities (LineCapacity()) and the reports (Breakdown()) use
 
 import numpy as np
+import KernelCache # Keys the kernel cache to the sources, before any kernel is defined
 from numba import jit
 
-@jit(nopython=True)
-def Transmission(solution, output=False):
-    MPV = np.zeros((solution.nodes, solution.intervals))
-    MWind = np.zeros((solution.nodes, solution.intervals))
-
-    for i, j in enumerate(solution.Nodel_int):
-        MPV[i, :] = solution.GPV[:, np.where(solution.PVl_int==j)[0]].sum(axis=1)
-        MWind[i, :] = solution.GWind[:, np.where(solution.Windl_int==j)[0]].sum(axis=1)
-    MPV, MWind = (MPV.transpose(), MWind.transpose()) # Sij-GPV(t, i), Sij-GWind(t, i), MW
-
-    MBaseload = solution.GBaseload # MW
-    pkfactor = solution.CPeak / solution.CPeak.sum()
-    MPeak = solution.flexible.transpose() * np.atleast_2d(pkfactor)
-
-    MLoad_denominator = np.atleast_2d(solution.MLoad.sum(axis=1))
-    defactor = np.divide(solution.MLoad, MLoad_denominator.transpose())
-    MDeficit = solution.Deficit.transpose() * defactor # MDeficit: EDE(j, t)
-
-    MPW = MPV + MWind
-    MPW_denominator = np.atleast_2d(MPW.sum(axis=1) + 0.000001)
-    spfactor = np.divide(MPW, MPW_denominator.transpose())
-    MSpillage = solution.Spillage.transpose() * spfactor # MSpillage: ESP(j, t)
-
-    CPHP = solution.CPHP
-    pcfactor = np.atleast_2d(CPHP / sum(CPHP) if sum(CPHP) != 0 else np.zeros_like(CPHP))
-
-
-    MDischarge = solution.Discharge.transpose() * pcfactor # MDischarge: DPH(j, t) Has shape (Intervals, nodes * steps)
+@jit(nopython=True, cache=True)
+def Shares(CPHP, CPeak, steps):
+    """Share of each node in the storage power capacity of each step, pcfactor(s, j), and in flexible capacity,
+    pkfactor(j). CPHP holds the cumulative capacity (GW) of each node, step by step"""
+    nodes = len(CPHP) // steps
+    pcfactor = np.zeros((steps, nodes))
+    for s in range(steps):
+        CPHPs = CPHP[s * nodes:(s + 1) * nodes] # Storage power capacity of each node in this step, GW
+        if CPHPs.sum() != 0:
+            pcfactor[s] = CPHPs / CPHPs.sum()
+    pkfactor = CPeak / CPeak.sum() if CPeak.sum() > 0 else np.full(nodes, 1 / nodes) # No flexible capacity to share
+    return pcfactor, pkfactor
+
+
+@jit(nopython=True, cache=True)
+def NodalImport(t0, t1, MLoad, MPV, MWind, MBaseload, pcfactor, pkfactor, flexible, Deficit, Spillage, Charge, Discharge, MImport, Components=None):
+    """Net imports of the nodes in intervals t0 to t1 of one step, MImport(t - t0, j) in MW, with the shares pcfactor(j)
+    of that step. The system-wide deficit is broken down to the nodes by their share of load, spillage by their share
+    of PV and wind, storage by their share of its power capacity and flexible by their share of its capacity. Baseload
+    given as one system-wide column is apportioned by share of load, as the deficit is, so that the net imports of the
+    nodes balance and the flows are exact. The breakdown of baseload, flexible, deficit, spillage, discharge and charge
+    is written to Components(6, t - t0, j) if it is given"""
+    nodes = MLoad.shape[1]
+    bcol = MBaseload.shape[1] == nodes # Baseload given per node
+
+    for t in range(t0, t1):
+        Load_sum, PW_sum, Baseload_sum = 0.0, 0.0, 0.0
+        for j in range(nodes):
+            Load_sum += MLoad[t, j]
+            PW_sum += MPV[t, j] + MWind[t, j]
+        PW_sum += 0.000001
+        if not bcol:
+            for j in range(MBaseload.shape[1]):
+                Baseload_sum += MBaseload[t, j]
+
+        for j in range(nodes):
+            MPW = MPV[t, j] + MWind[t, j]
+            MBaseloadj = MBaseload[t, j] if bcol else Baseload_sum * MLoad[t, j] / Load_sum
+            MPeakj = flexible[t] * pkfactor[j]
+            MDeficitj = Deficit[t] * MLoad[t, j] / Load_sum
+            MSpillagej = Spillage[t] * MPW / PW_sum
+            MDischargej = Discharge[t] * pcfactor[j]
+            MChargej = Charge[t] * pcfactor[j]
+            MImport[t - t0, j] = MLoad[t, j] + MChargej + MSpillagej - MPW - MBaseloadj - MPeakj - MDischargej - MDeficitj # EIM(t, j), MW
+
+            if Components is not None:
+                Components[0, t - t0, j], Components[1, t - t0, j], Components[2, t - t0, j] = MBaseloadj, MPeakj, MDeficitj
+                Components[3, t - t0, j], Components[4, t - t0, j], Components[5, t - t0, j] = MSpillagej, MDischargej, MChargej
+
+
+@jit(nopython=True, cache=True)
+def Breakdown(MLoad, MPV, MWind, MBaseload, CPHP, CPeak, steps, flexible, Deficit, Spillage, Charge, Discharge, Storage):
+    """NodalImport() of every interval, for reporting. Returns MImport(t, j) and the breakdown Components(7, t, j) of
+    baseload, flexible, deficit, spillage, discharge, charge and storage to the nodes, MW (MWh for storage)"""
+    intervals, nodes = MLoad.shape
+    split = intervals // steps
+    pcfactor, pkfactor = Shares(CPHP, CPeak, steps)
+
+    MImport = np.zeros((intervals, nodes))
+    Components = np.zeros((7, intervals, nodes))
+    for s in range(steps):
+        start, end = s * split, (s + 1) * split if s < steps - 1 else intervals
+        NodalImport(start, end, MLoad, MPV, MWind, MBaseload, pcfactor[s], pkfactor, flexible, Deficit, Spillage, Charge, Discharge,
+                    MImport[start:end], Components[:6, start:end])
+        for t in range(start, end):
+            Components[6, t] = Storage[t] * pcfactor[s]
+
+    return MImport, Components
 
-    MCharge = solution.Charge.transpose() * pcfactor # MCharge: CHPH(j, t)
 
-    MImport = solution.MLoad + MCharge + MSpillage \
-              - MPV - MWind - MBaseload - MPeak - MDischarge - MDeficit # EIM(t, j), MW
-
-    # ['FNQ', 'NSW', 'NT', 'QLD', 'SA', 'TAS', 'VIC', 'WA'] = [0, 1, 2, 3, 4, 5, 6, 7] for Nodel = Nodel_int
-
-    FQ = -1 * MImport[:, np.where(solution.Nodel_int==0)[0][0]] if 0 in solution.Nodel_int else np.zeros(solution.intervals)
-    AS = -1 * MImport[:, np.where(solution.Nodel_int==2)[0][0]] if 2 in solution.Nodel_int else np.zeros(solution.intervals)
-    SW = MImport[:, np.where(solution.Nodel_int==7)[0][0]] if 7 in solution.Nodel_int else np.zeros(solution.intervals)
-    TV = -1 * MImport[:, np.where(solution.Nodel_int==5)[0][0]]
-
-    NQ = MImport[:, np.where(solution.Nodel_int==3)[0][0]] - FQ
-    NV = MImport[:, np.where(solution.Nodel_int==6)[0][0]] - TV
-
-    NS = -1 * MImport[:, np.where(solution.Nodel_int==1)[0][0]] - NQ - NV
-    NS1 = MImport[:, np.where(solution.Nodel_int==4)[0][0]] - AS + SW
-    #assert abs(NS - NS1).max()<=0.1, print(abs(NS - NS1).max())
-
-    TDC = np.vstack((FQ, NQ, NS, NV, AS, SW, TV)).transpose() # TDC(t, k), MW
-
-    return TDC
\ No newline at end of file
+@jit(nopython=True)
+def TransmissionCapacity(solution, DCloss):
+    """Line capacities of a simulated Solution, streamed over intervals without the (t, j) and (t, k) arrays. Returns
+    CDC(k), the peak |flow| on each line in MW, and the losses summed over intervals, MW"""
+    return LineCapacity(solution.MLoad, solution.GPV, solution.GWind, solution.GBaseload, solution.Flowmap, solution.CPHP, solution.CPeak, int(solution.steps),
+                        solution.flexible[0], solution.Deficit[0], solution.Spillage[0], solution.Charge[0], solution.Discharge[0], DCloss)
+
+
+@jit(nopython=True, cache=True)
+def LineCapacity(MLoad, MPV, MWind, MBaseload, Flowmap, CPHP, CPeak, steps, flexible, Deficit, Spillage, Charge, Discharge, DCloss, chunk=256):
+    """TransmissionCapacity() on the arrays of a solution, so that it can be run on scratch buffers without one. Net
+    imports are broken down to the nodes chunk intervals at a time"""
+    nodes, lines = Flowmap.shape
+    intervals = len(Deficit)
+    split = intervals // steps
+    pcfactor, pkfactor = Shares(CPHP, CPeak, steps)
+
+    CDC = np.zeros(lines) # MW
+    TDC_abs = np.zeros(lines) # MW summed over intervals
+    MImport = np.zeros((chunk, nodes)) # EIM(t, j) of a chunk of intervals, MW
+
+    for s in range(steps):
+        end = (s + 1) * split if s < steps - 1 else intervals
+
+        for t0 in range(s * split, end, chunk):
+            t1 = min(t0 + chunk, end)
+            NodalImport(t0, t1, MLoad, MPV, MWind, MBaseload, pcfactor[s], pkfactor, flexible, Deficit, Spillage, Charge, Discharge, MImport)
+
+            for t in range(t0, t1):
+                for k in range(lines):
+                    TDCt = 0.0
+                    for j in range(nodes):
+                        TDCt += MImport[t - t0, j] * Flowmap[j, k]
+                    TDCt = abs(TDCt)
+                    TDC_abs[k] += TDCt
+                    if TDCt > CDC[k]:
+                        CDC[k] = TDCt
+
+    return CDC, (TDC_abs * DCloss).sum()
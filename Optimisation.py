@@ -9,46 +9,107 @@
 # - Added support capacity expansion under FIRM_CE
 # - Added support for parallisation of candidate solutions
 # - check_limits()
+# - F_batch() to evaluate the whole population with one pass of the storage recursion
+# - Optional multi-fidelity screening of candidates on block-averaged traces (-screen)
+# - Optional representative-week reduction of the time series, validated at full resolution (-reduce)
+# - Kernels take the ScenarioData of an Input.Scenario instead of module globals. Arguments are parsed in main()
+# - Kernels are cached on disk and compiled ahead of the optimisation by warmup() (-warmup to only compile)
+# - The kernel cache is keyed by a hash of every kernel source (KernelCache), so edits to a callee aren't missed
+# - Line capacities and losses in F() from TransmissionCapacity() instead of the full TDC(t, k)
+# - Objective values are memoised (-memo, -memosize, -memofile)
+# - Progress of each iteration is written to a binary log by a background thread (ResultsLog), with the objective of
+#   the best candidate taken from differential evolution instead of evaluating it again
+# - Periodic checkpoints of the differential evolution state and -resume to continue from the last one
+# - Island model with -w > 1: separate populations in separate processes with migration (Islands)
+# - CMA-ES backend (-optimiser cmaes) with the same callback and results log as differential evolution
+# - Non-interactive runs (-guess, -seed, -job) for sweeps. main() returns the result
+# - Optional surrogate model (-surrogate) choosing the fraction of candidates to evaluate, checkpointed with the solver
+# - Optional per-stage cycle counters in the kernels (-profile) with a per-generation report (Instrumentation)
+# - F_lean() evaluates candidates with transmission in per-thread scratch buffers instead of a Solution each. F() is
+#   kept as the full-detail reference
+# - The cost quantities of a candidate are computed apart from the cost factors (Quantities(), QuantitiesBatch()) for
+#   cost sensitivities without simulating again (Sensitivity)
+# - Optional polish of the result by pattern search at full resolution (-polish), polling all directions in one batch
 
 
 import datetime as dt
-from scipy.optimize import differential_evolution
-from numba import jit, float64, prange
+from scipy.optimize._differentialevolution import DifferentialEvolutionSolver
+import KernelCache # Keys the kernel cache to the sources, before any kernel is defined
+from numba import jit, float64, prange, get_num_threads, get_thread_id
 import numpy as np
 from argparse import ArgumentParser
 import csv
+import os
 import sys
 
+from Input import Scenario, Solution, synthetic
+from Simulation import Reliability, ReliabilityBatch, ReliabilityDual, ReliabilityLean
+from Network import TransmissionCapacity, LineCapacity
+from GenCalculator import GenTCalc
+from PCapCalculator import PCapSteps
+from Screening import aggregate, aggregate_weights, Screen
+from Surrogate import Surrogate
+from Reduction import representative_weeks
+from Memoisation import EvaluationCache
+from ResultsLog import IterationLog
+import Checkpoint
+import Islands
+from Optimisers import CMAES, Counter, PatternSearch
+import Instrumentation
+from Instrumentation import cycles, lap, Profile, SOLUTION, RELIABILITY, TRANSMISSION, COST, BUSY, EVALUATIONS
+
 parser = ArgumentParser()
 parser.add_argument('-i', default=1000, type=int, required=False, help='maxiter=4000, 400')
-parser.add_argument('-p', default=100, type=int, required=False, help='popsize=2, 10')
+parser.add_argument('-p', default=100, type=int, required=False, help='popsize=2, 10. Samples per generation with -optimiser cmaes')
 parser.add_argument('-m', default=0.6, type=float, required=False, help='mutation=0.5')
 parser.add_argument('-r', default=0.3, type=float, required=False, help='recombination=0.3')
 parser.add_argument('-s', default=1, type=int, required=False, help='11, 12, 13, ...')
 parser.add_argument('-n', default='Super1', type=str, required=False, help='node=Super1')
+parser.add_argument('-optimiser', default='de', choices=['de', 'cmaes'], required=False, help='Differential evolution or CMA-ES')
+parser.add_argument('-sigma', default=0.3, type=float, required=False, help='Initial CMA-ES step size, relative to the bounds')
 parser.add_argument('-w', default=1, type=int, required=False, help='Number of islands in differential evolution (i.e. workers)')
+parser.add_argument('-migrate', default=10, type=int, required=False, help='Generations between migrations of the islands')
+parser.add_argument('-migrants', default=1, type=int, required=False, help='Best members each island sends at a migration')
+parser.add_argument('-topology', default='ring', choices=['ring', 'full'], required=False, help='Islands that receive the migrants of an island')
 parser.add_argument('-steps', default=1, type=int, required=False, help='Number of steps in capacity expansion')
-args = parser.parse_args()
-
-scenario = args.s
-node = args.n
-steps = args.steps
-
-from Input import *
-from Simulation import Reliability
-from Network import Transmission
+parser.add_argument('-screen', default=0, type=int, required=False, help='Block length (intervals) of coarse candidate screening. 0 disables')
+parser.add_argument('-margin', default=0.1, type=float, required=False, help='Relative margin of the coarse objective in screening')
+parser.add_argument('-reduce', default=0, type=int, required=False, help='Representative weeks per step to optimise on. 0 uses the full time series')
+parser.add_argument('-surrogate', default=0, type=float, required=False, help='Fraction of candidates ranked best by a surrogate model to evaluate. 0 disables')
+parser.add_argument('-memo', default=1e-6, type=float, required=False, help='Tolerance (GW, GWh) within which candidates reuse a cached objective. 0 for exact matches')
+parser.add_argument('-memosize', default=10000, type=int, required=False, help='Maximum number of cached objectives. 0 disables the cache')
+parser.add_argument('-memofile', default='', type=str, required=False, help='File to keep the cache in between runs')
+parser.add_argument('-checkpoint', default=10, type=int, required=False, help='Iterations between checkpoints of the optimiser state. 0 disables')
+parser.add_argument('-resume', '--resume', action='store_true', help='Continue from the last checkpoint of this scenario (no initial guess prompt)')
+parser.add_argument('-guess', default='ask', choices=['ask', 'y', 'n'], required=False, help='Use the previous result as the initial guess. ask prompts for it')
+parser.add_argument('-job', default='', type=str, required=False, help='Name of the run in the log and checkpoint paths, e.g. a job of a sweep')
+parser.add_argument('-seed', default=None, type=int, required=False, help='Seed of the optimiser. Random if not given')
+parser.add_argument('-profile', action='store_true', help='Count the cycles of each stage of the objective and report them every generation')
+parser.add_argument('-polish', default=0, type=int, required=False, help='Iterations of pattern search to polish the result with. 0 disables')
+parser.add_argument('-polishstep', default=0.01, type=float, required=False, help='Initial pattern search step, relative to the bounds')
+parser.add_argument('-warmup', action='store_true', help='Compile the kernels into the on-disk cache and exit')
+
+
+# Energy deficit with all flexible capacity available. The Solution is built inside so that the kernel can be cached
+@jit(nopython=True, cache=True)
+def limits_deficit(x, data):
+    S = Solution(x, data)
+
+    Deficit = Reliability(S, flexible=np.ones(data.intervals, dtype=np.float64)*data.CPeak.sum()*1000) # Sj-EDE(t, j), GW to MW
+    return Deficit.sum() * data.resolution
 
 
 # Quick check to ensure load can be met at all timeteps with defined build limits
-def check_limits():   
-    test = np.array([PVBuildRateLimit] * pzones + [WindBuildRateLimit]  * wzones + [50.] * nodes * steps + [50.], dtype=np.float64)
-
-    S = Solution(test)
+# Exits unless exit=False, e.g. when main() is called from Python (Sweep), which raises ValueError instead
+def check_limits(scenario, exit=True):   
+    data = scenario.data
+    test = np.array([scenario.pvlimit] * data.pzones + [scenario.windlimit]  * data.wzones + [50.] * data.nodes * data.steps + [50.], dtype=np.float64)
 
-    Deficit = Reliability(S, flexible=np.ones(intervals, dtype=np.float64)*CPeak.sum()*1000) # Sj-EDE(t, j), GW to MW
-    Deficit_sum = Deficit.sum() * resolution
+    Deficit_sum = limits_deficit(test, data)
     if Deficit_sum > 0: 
         print('Not possible to match load  with current build limits')
+        if not exit:
+            raise ValueError('Not possible to match load with current build limits')
         print('Ending Optimisation...')
         sys.exit(0)
     else: 
@@ -58,11 +119,12 @@ def check_limits():
 
 # Imports previous best solution as initial guess. Scenario definitions must remain unchanged to use.
 def get_initial_guess():
-    while True:
+    response = args.guess
+    while response == 'ask':
         response = input("Would you like to import the results of the previous optimisation as the initial guess for this run? All scenario declerations should be kept the same as previous (y/n): ").strip().lower()
-        if response in ['y', 'n']:
-            break
-        print("Please enter 'y' or 'n'.")
+        if response not in ['y', 'n']:
+            print("Please enter 'y' or 'n'.")
+            response = 'ask'
 
     if response == 'y':
         print("Importing previous as initial guess")
@@ -83,104 +145,476 @@ def get_initial_guess():
 
 
 # Paralliser to run candidate solutions on F(x) in parallel
-@jit(parallel=True)
-def parallel_object_wrapper(xs):
+def parallel_object_wrapper(xs, data, counters=None):
+    if 'Super' not in data.node:
+        if counters is None:
+            return F_batch(xs, data, data.MLoad_sum, data.TSPV, data.TSWind, data.GBaseload_sum, data.weights, data.resolution)
+        return F_batch(xs, data, data.MLoad_sum, data.TSPV, data.TSWind, data.GBaseload_sum, data.weights, data.resolution, counters)
+
+    # Transmission requires the full time series of each candidate. The number of threads is taken here, as a kernel
+    # calling get_num_threads() can't be cached
+    if counters is None:
+        return F_parallel(xs, data, get_num_threads())
+    return F_parallel(xs, data, get_num_threads(), counters)
+
+@jit(parallel=True, cache=True)
+def F_parallel(xs, data, threads, counters=None):
+    """F_lean() of each candidate in parallel. The time series of a candidate are built in scratch buffers of the thread
+    evaluating it, so memory grows with the number of threads rather than the population"""
+    flexible = np.ones(data.intervals, dtype=np.float64)*data.CPeak.sum()*1000 # GW to MW
+    Generation = np.empty((threads, 2, data.intervals, data.nodes), dtype=np.float64)
+    Trajectories = np.empty((threads, 4, data.intervals), dtype=np.float64)
+
     result = np.empty(xs.shape[1], dtype=np.float64)
     for i in prange(xs.shape[1]):
-        result[i] = F(xs[:,i])
+        thread = get_thread_id()
+        if counters is not None:
+            start = cycles()
+        result[i] = F_lean(xs[:,i], data, flexible, Generation[thread], Trajectories[thread], counters)
+        if counters is not None:
+            lap(counters, BUSY, start)
+            counters[thread, EVALUATIONS] += 1
     return result
 
-@jit(nopython=True)
-def F(x):
-    """This is the objective function."""
+# Cost quantities, levelised energy and penalties of each candidate, for cost sensitivities (Sensitivity)
+def parallel_quantities(xs, data):
+    if 'Super' not in data.node:
+        return QuantitiesBatch(xs, data, data.MLoad_sum, data.TSPV, data.TSWind, data.GBaseload_sum, data.weights, data.resolution)
+    return QuantitiesParallel(xs, data, get_num_threads())
+
+@jit(parallel=True, cache=True)
+def QuantitiesParallel(xs, data, threads):
+    """Quantities() of each candidate in parallel, in the scratch buffers of F_parallel()"""
+    flexible = np.ones(data.intervals, dtype=np.float64)*data.CPeak.sum()*1000 # GW to MW
+    Generation = np.empty((threads, 2, data.intervals, data.nodes), dtype=np.float64)
+    Trajectories = np.empty((threads, 4, data.intervals), dtype=np.float64)
+
+    ncand = xs.shape[1]
+    quantities = np.empty((len(data.factor), ncand), dtype=np.float64)
+    energy, PenDeficit, PenHydro = np.empty(ncand), np.empty(ncand), np.empty(ncand)
+    for i in prange(ncand):
+        thread = get_thread_id()
+        quantities[:, i], energy[i], PenDeficit[i], PenHydro[i] = Quantities(xs[:,i], data, flexible, Generation[thread], Trajectories[thread])
+    return quantities, energy, PenDeficit, PenHydro
+
+@jit(nopython=True, cache=True)
+def F(x, data, counters=None):
+    """This is the objective function. Cycles of each stage are added to counters (Instrumentation) if given"""
+    node, steps, intervals, years = data.node, data.steps, data.intervals, data.years
+    resolution, efficiency, energy = data.resolution, data.efficiency, data.energy
+    CPeak, DCloss, factor = data.CPeak, data.DCloss, data.factor
 
     #Objective Function starts here
-    S = Solution(x)
-
-    Deficit = Reliability(S, flexible=np.zeros(intervals, dtype=np.float64)) # Sj-EDE(t, j), MW
-    Flexible = Deficit.sum() * resolution / years / efficiency # MWh p.a.
+    if counters is not None:
+        start = cycles()
+    S = Solution(x, data)
+    if counters is not None:
+        start = lap(counters, SOLUTION, start)
+
+    # Trajectories with flexible are only kept when Transmission needs them
+    DeficitNoFlex, Deficit = ReliabilityDual(S, np.ones(intervals, dtype=np.float64)*CPeak.sum()*1000, 'Super' in node) # MW, GW to MW
+    if counters is not None:
+        start = lap(counters, RELIABILITY, start)
+    Flexible = DeficitNoFlex * resolution / years / efficiency # MWh p.a.
     Hydro = Flexible * resolution / years # Hydropower & biomass: MWh p.a.
     PenHydro = max(0, Hydro - 20 * 1000000) # TWh p.a. to MWh p.a.
 
-    Deficit = Reliability(S, flexible=np.ones(intervals, dtype=np.float64)*CPeak.sum()*1000) # Sj-EDE(t, j), GW to MW
-    Deficit_sum = Deficit.sum() * resolution
+    Deficit_sum = Deficit * resolution
     PenDeficit = max(0, Deficit_sum) # MWh
 
 
-    TDC = Transmission(S) if 'Super' in node else np.zeros((intervals, len(DCloss)), dtype=np.float64)  # TDC: TDC(t, k), MW
-    TDC_abs = np.abs(TDC)
-
-    CDC = np.zeros(len(DCloss), dtype=np.float64)
-    for i in range(0,intervals):
-        for j in range(0,len(DCloss)):
-            if TDC_abs[i][j] > CDC[j]:
-                CDC[j] = TDC_abs[i][j]
+    # Peak flow and losses of each line, streamed over intervals. Zero without transmission
+    if 'Super' in node:
+        CDC, loss = TransmissionCapacity(S, DCloss) # MW
+    else:
+        CDC, loss = np.zeros(len(DCloss), dtype=np.float64), 0.0
     CDC = CDC * 0.001 # CDC(k), MW to GW
+    if counters is not None:
+        start = lap(counters, TRANSMISSION, start)
 
 
     cost = factor *  np.concatenate((np.array([S.CPV[int(len(S.CPV) * (1 - 1/steps)):int(len(S.CPV))].sum(), S.CWind[int(len(S.CWind) * (1 - 1/steps)):int(len(S.CWind))].sum(), S.CPHP[int(len(S.CPHP) * (1 - 1/steps)):int(len(S.CPHP))].sum(), S.CPHS]), CDC, np.array([S.CPV[int(len(S.CPV) * (1 - 1/steps)):int(len(S.CPV))].sum(), S.CWind[int(len(S.CWind) * (1 - 1/steps)):int(len(S.CWind))].sum(), Hydro * 0.000001, -1.0, -1.0])))
     cost = cost.sum()
 
-    loss = TDC_abs.sum(axis=0) * DCloss
-    loss = loss.sum() * 0.000000001 * resolution / years # PWh p.a.
+    loss = loss * 0.000000001 * resolution / years # PWh p.a.
     LCOE = cost / abs(energy - loss)
 
     Func = LCOE + PenDeficit + PenHydro 
+    if counters is not None:
+        lap(counters, COST, start)
     
     return Func
 
+@jit(nopython=True, cache=True)
+def F_lean(x, data, flexible, Generation, Trajectories, counters=None):
+    """F() without a Solution, for the optimisation. Generation at each node is built in Generation(2, t, j) and the
+    trajectories transmission needs in Trajectories(4, t), scratch buffers of the calling thread, so nothing of length
+    intervals is allocated per candidate. flexible(t) is the flexible capacity (MW) shared by all candidates"""
+    quantities, energy, PenDeficit, PenHydro = Quantities(x, data, flexible, Generation, Trajectories, counters)
+    if counters is not None:
+        start = cycles()
+
+    cost = data.factor * quantities
+    cost = cost.sum()
+    LCOE = cost / energy
+
+    Func = LCOE + PenDeficit + PenHydro
+    if counters is not None:
+        lap(counters, COST, start)
+
+    return Func
+
+@jit(nopython=True, cache=True)
+def Quantities(x, data, flexible, Generation, Trajectories, counters=None):
+    """Simulates a candidate as F_lean() does. Returns the quantities(f) its cost is factor . quantities of, the energy
+    (PWh p.a., net of losses) that is levelised over and the deficit and hydro penalties, none of which depend on the
+    cost factors"""
+    node, steps, intervals, years = data.node, data.steps, data.intervals, data.years
+    pidx, widx, sidx = data.pidx, data.widx, data.sidx
+    resolution, efficiency, energy = data.resolution, data.efficiency, data.energy
+    CPeak, DCloss = data.CPeak, data.DCloss
+
+    if counters is not None:
+        start = cycles()
+
+    # Cumulative capacities in each step, as in Solution
+    CPV, CWind, CPHP = x[:pidx].copy(), x[pidx:widx].copy(), x[widx:sidx].copy() # GW
+    CPHS = x[sidx] # GWh
+    for C in (CPV, CWind, CPHP):
+        split = int(len(C)/steps)
+        for i in range(1, steps):
+            C[split*i:split*(i+1)] += C[split*(i-1):split*i]
+
+    GPV = GenTCalc(data.TSPV, CPV, data.PVnode, steps, intervals, Generation[0]) # GPV(t, j), MW
+    GWind = GenTCalc(data.TSWind, CWind, data.Windnode, steps, intervals, Generation[1]) # GWind(t, j), MW
+
+    Pcapacity = PCapSteps(CPHP, steps) # MW
+    if counters is not None:
+        start = lap(counters, SOLUTION, start)
+
+    # Trajectories with flexible are only kept when transmission needs them
+    if 'Super' in node:
+        DeficitNoFlex, Deficit = ReliabilityLean(data.MLoad, GPV, GWind, data.GBaseload, Pcapacity, CPHS * 1000, flexible, resolution, efficiency, Trajectories) # MW
+    else:
+        DeficitNoFlex, Deficit = ReliabilityLean(data.MLoad, GPV, GWind, data.GBaseload, Pcapacity, CPHS * 1000, flexible, resolution, efficiency) # MW
+    if counters is not None:
+        start = lap(counters, RELIABILITY, start)
+    Flexible = DeficitNoFlex * resolution / years / efficiency # MWh p.a.
+    Hydro = Flexible * resolution / years # Hydropower & biomass: MWh p.a.
+    PenHydro = max(0, Hydro - 20 * 1000000) # TWh p.a. to MWh p.a.
+
+    PenDeficit = max(0, Deficit * resolution) # MWh
+
+    if 'Super' in node:
+        CDC, loss = LineCapacity(data.MLoad, GPV, GWind, data.GBaseload, data.Flowmap, CPHP, CPeak, steps, flexible,
+                                 Trajectories[2], Trajectories[3], Trajectories[1], Trajectories[0], DCloss) # MW
+    else:
+        CDC, loss = np.zeros(len(DCloss), dtype=np.float64), 0.0
+    CDC = CDC * 0.001 # CDC(k), MW to GW
+    if counters is not None:
+        start = lap(counters, TRANSMISSION, start)
+
+    # Cost components in the order of factor
+    CPVs, CWinds, CPHPs = CPV[int(len(CPV) * (1 - 1/steps)):].sum(), CWind[int(len(CWind) * (1 - 1/steps)):].sum(), CPHP[int(len(CPHP) * (1 - 1/steps)):].sum()
+    quantities = np.concatenate((np.array([CPVs, CWinds, CPHPs, CPHS]), CDC, np.array([CPVs, CWinds, Hydro * 0.000001, -1.0, -1.0])))
+
+    loss = loss * 0.000000001 * resolution / years # PWh p.a.
+
+    return quantities, abs(energy - loss), PenDeficit, PenHydro
+
+@jit(nopython=True, cache=True)
+def F_batch(xs, data, Load, PV, Wind, Baseload, Weights, dataresolution, counters=None):
+    """Population-batched objective function for scenarios without transmission. xs(v, c) holds one candidate per column.
+    Load(t), PV(t, i), Wind(t, i) and Baseload(t) may be coarser or shorter than the input data, with dataresolution
+    hours per interval and each interval recurring Weights(t) times. Cycles of each stage of the whole population are
+    added to counters (Instrumentation) if given"""
+    quantities, energy, PenDeficit, PenHydro = QuantitiesBatch(xs, data, Load, PV, Wind, Baseload, Weights, dataresolution, counters)
+    if counters is not None:
+        start = cycles()
+
+    cost = np.dot(data.factor, quantities)
+    LCOE = cost / energy
+    if counters is not None:
+        lap(counters, COST, start)
+        counters[get_thread_id(), EVALUATIONS] += xs.shape[1]
+
+    return LCOE + PenDeficit + PenHydro
+
+@jit(nopython=True, cache=True)
+def QuantitiesBatch(xs, data, Load, PV, Wind, Baseload, Weights, dataresolution, counters=None):
+    """Simulates a population as F_batch() does. Returns the quantities(f, c) the cost of each candidate is
+    factor . quantities of, the energy (PWh p.a.) that is levelised over and the deficit and hydro penalties of each
+    candidate"""
+    steps, nodes, years, pzones, wzones = data.steps, data.nodes, data.years, data.pzones, data.wzones
+    pidx, widx, sidx = data.pidx, data.widx, data.sidx
+    resolution, efficiency, energy = data.resolution, data.efficiency, data.energy
+    CPeak, DCloss, factor = data.CPeak, data.DCloss, data.factor
+
+    ncand = xs.shape[1]
+    if counters is not None:
+        start = cycles()
+    pvsites, windsites = pzones // steps, wzones // steps
+
+    # Cumulative capacities in each step, candidates innermost
+    CPV = np.empty((steps, pvsites, ncand)) # GW
+    CWind = np.empty((steps, windsites, ncand)) # GW
+    CPHP = np.empty((steps, nodes, ncand)) # GW
+    for i in range(steps):
+        CPV[i] = xs[i*pvsites : (i+1)*pvsites]
+        CWind[i] = xs[pidx + i*windsites : pidx + (i+1)*windsites]
+        CPHP[i] = xs[widx + i*nodes : widx + (i+1)*nodes]
+        if i > 0:
+            CPV[i] += CPV[i-1]
+            CWind[i] += CWind[i-1]
+            CPHP[i] += CPHP[i-1]
+    CPHS = xs[sidx] # GWh
+
+    CPHP_flat = CPHP.reshape((steps * nodes, ncand))
+    Pcapacity = np.empty((steps, ncand))
+    for c in range(ncand):
+        Pcapacity[:, c] = PCapSteps(CPHP_flat[:, c], steps) # GW to MW
+    Scapacity = CPHS * 1000 # GWh to MWh
+    if counters is not None:
+        start = lap(counters, SOLUTION, start)
+
+    DeficitNoFlex, Deficit = ReliabilityBatch(CPV, CWind, Pcapacity, Scapacity, Load, PV, Wind, Baseload, np.ones(len(Load), dtype=np.float64)*CPeak.sum()*1000, Weights, dataresolution, efficiency) # MW, GW to MW
+    if counters is not None:
+        start = lap(counters, RELIABILITY, start)
+    Flexible = DeficitNoFlex * dataresolution / years / efficiency # MWh p.a.
+    Hydro = Flexible * resolution / years # Hydropower & biomass: MWh p.a.
+    PenHydro = np.maximum(0, Hydro - 20 * 1000000) # TWh p.a. to MWh p.a.
+
+    PenDeficit = np.maximum(0, Deficit * dataresolution) # MWh
+
+    # Cost components in the order of factor. Transmission (CDC) and losses are zero without transmission
+    quantities = np.zeros((len(factor), ncand))
+    quantities[0] = CPV[steps-1].sum(axis=0)
+    quantities[1] = CWind[steps-1].sum(axis=0)
+    quantities[2] = CPHP[steps-1].sum(axis=0)
+    quantities[3] = CPHS
+    quantities[4 + len(DCloss)] = CPV[steps-1].sum(axis=0)
+    quantities[5 + len(DCloss)] = CWind[steps-1].sum(axis=0)
+    quantities[6 + len(DCloss)] = Hydro * 0.000001
+    quantities[7 + len(DCloss)] = -1.0
+    quantities[8 + len(DCloss)] = -1.0
+
+    return quantities, abs(energy), PenDeficit, PenHydro
+
+
+# Compiles every kernel (or loads it from the on-disk cache) against synthetic data of the same types as the scenario.
+# The cache is keyed by a hash of the kernel sources (KernelCache), because numba only checks the file a kernel is
+# defined in and would keep running a cached F after an edit to a module it inlines, such as Network or Simulation.
+# After any edit to those modules the first run compiles everything again
+def warmup(node='Super1', steps=1, popsize=4, profile=False):
+    start = dt.datetime.now()
+
+    data = synthetic(Scenario(node=node, steps=steps))
+    xs = np.random.default_rng(0).uniform(0, 10, (data.sidx + 1, popsize))
+    traces = (data.MLoad_sum, data.TSPV, data.TSWind, data.GBaseload_sum, data.weights, data.resolution)
+
+    # differential_evolution passes the population F-ordered, screening passes promoted candidates C-ordered
+    for population in (np.asfortranarray(xs), np.ascontiguousarray(xs)):
+        parallel_object_wrapper(population, data)
+        F_batch(population, data, *traces)
+        parallel_quantities(population, data)
+        if profile:
+            parallel_object_wrapper(population, data, Instrumentation.counters())
+            F_batch(population, data, *traces, Instrumentation.counters())
+    F(np.ascontiguousarray(xs[:, 0]), data)
+    limits_deficit(np.ascontiguousarray(xs[:, 0]), data)
+
+    elapsed = dt.datetime.now() - start
+    print("Compilation took", elapsed)
+    return elapsed
+
 
 # Callback function to output results on every itteration
 iteration_count = 0
-def callback(xk, convergence=None):
+screens = [] # Profile, Screen and Surrogate, updated with the population every generation
+log = None
+counter = None
+solver = None
+checkpoint = None # Path and tag of this scenario's checkpoint
+def callback(intermediate_result):
     global iteration_count
     iteration_count += 1
-    now = dt.datetime.now()
-    elapsed = now - starttime
-    funcValue = F(xk)
+    xk = intermediate_result.x
+    for screen in screens:
+        screen.update(intermediate_result.population_energies)
+    elapsed = (dt.datetime.now() - starttime).total_seconds()
 
-    try:
+    # The objective of the best candidate was computed with the population (on the reduced time series with -reduce)
+    log.append(iteration_count, counter.nfev, elapsed, intermediate_result.fun, xk)
+
+    if solver is not None and args.checkpoint > 0 and iteration_count % args.checkpoint == 0:
+        Checkpoint.save(*checkpoint, solver=solver, iteration=iteration_count, surrogate=model(screens))
 
-        with open('Results/Optimisation_result_node(s){}_steps{}_{}.csv'.format(args.n, args.steps, starttime), 'a', newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow([iteration_count, elapsed, funcValue, *xk])
-    except:
-        print("Unable to access CSV for itteration: ", iteration_count)
 
+def model(screens):
+    """The Surrogate among the screens, if any. Its training set is checkpointed with the solver"""
+    return next((screen for screen in screens if isinstance(screen, Surrogate)), None)
 
 
-def main():
-    initial_guess = get_initial_guess() #Confirm whether to use results of previous optimisation
 
-    check_limits() #Check if optimisation is possible under current build limits
+def objective(args, scenario):
+    """Vectorised objective for the options in args. Returns it with the Profile, Screen and Surrogate it goes
+    through, its EvaluationCache (or None), whether it is evaluated on reduced traces and a tag identifying it in saved
+    caches and checkpoints"""
+    data = scenario.data
+
+    func = lambda xs: parallel_object_wrapper(xs, data)
+    kernel = lambda xs, counters: parallel_object_wrapper(xs, data, counters)
+    traces = (data.MLoad_sum, data.TSPV, data.TSWind, data.GBaseload_sum, data.weights, data.resolution)
+    reduced = args.reduce > 0 and 'Super' not in scenario.node
+    if reduced:
+        traces = representative_weeks(*traces[:4], scenario.steps, args.reduce, length=int(168 / data.resolution)) + (data.resolution,)
+        func = lambda xs: F_batch(xs, data, *traces)
+        kernel = lambda xs, counters: F_batch(xs, data, *traces, counters)
+    elif args.reduce > 0:
+        print('Time series reduction is not available with transmission. Continuing at full resolution')
+
+    tag = '{} {} {} {}'.format(scenario.key(), scenario.pvlimit, scenario.windlimit, args.reduce if reduced else 0)
+
+    # The profile counts the evaluations that get past the cache, surrogate and screening
+    screens = []
+    if args.profile:
+        func = Profile(kernel)
+        screens.append(func)
+
+    # Screening estimates are not memoised, only the objective they are promoted to
+    cache = None
+    if args.memosize > 0:
+        cache = EvaluationCache(func, args.memo, args.memosize, args.memofile or None, tag)
+        func = cache
+
+    # The surrogate is fitted to full evaluations only, so it ranks the candidates that screening promotes
+    if args.surrogate > 0:
+        func = Surrogate(func, *scenario.bounds(), fraction=args.surrogate)
+        screens.append(func)
+
+    if args.screen > 0:
+        coarse = [aggregate(x, scenario.steps, args.screen) for x in traces[:4]] + [aggregate_weights(traces[4], scenario.steps, args.screen)]
+        func = Screen(lambda xs: F_batch(xs, data, *coarse, traces[5] * args.screen), func, args.margin)
+        screens.append(func)
+
+    return func, screens, cache, reduced, tag
+
+
+def polish(result, data, lb, ub, path):
+    """Refines the result by pattern search on the full objective, without the cache, screening or surrogate. The
+    objective against evaluations is written to path"""
+    search = PatternSearch(lambda xs: parallel_object_wrapper(xs, data), lb, ub, result.x, step=args.polishstep, maxiter=args.polish)
+    polished = search.solve()
+
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Iteration', 'Evaluations', 'Objective', 'Step'])
+        writer.writerows(search.history)
+
+    print("Polish: {} to {} ({:.4%} better) in {} evaluations. {}".format(search.fun0, polished.fun, (search.fun0 - polished.fun) / search.fun0, polished.nfev, polished.message))
+    result.x, result.fun = polished.x, polished.fun
+    return result
+
+
+def main(argv=None):
+    global args, scenario, screens
+    args = parser.parse_args(argv)
+    if args.resume and (args.w > 1 or args.optimiser != 'de'):
+        parser.error('-resume is only available with a single population of differential evolution (-w 1)')
+    if args.w > 1 and args.optimiser != 'de':
+        parser.error('Islands (-w) are only available with differential evolution')
+    if args.optimiser != 'de' and (args.screen > 0 or args.surrogate > 0):
+        parser.error('-screen and -surrogate assume the one-to-one selection of differential evolution')
+    # Seeds of a scenario, and the jobs of a sweep, may run at the same time
+    run = '_' + args.job if args.job else '_seed{}'.format(args.seed) if args.seed is not None else ''
+    checkpointfile = 'Results/Checkpoint_node(s){}_steps{}{}.npz'.format(args.n, args.steps, run)
+    if args.resume and not os.path.exists(checkpointfile):
+        parser.error('-resume found no checkpoint at {}'.format(checkpointfile))
+
+    warmup(node=args.n, steps=args.steps, profile=args.profile)
+    if args.warmup:
+        return
+
+    scenario = Scenario(node=args.n, steps=args.steps, scenario=args.s)
+    data = scenario.data
+
+    # Confirm whether to use results of previous optimisation. A resumed run takes its population from the checkpoint
+    initial_guess = get_initial_guess() if not args.resume else None
+
+    check_limits(scenario, exit=argv is None) #Check if optimisation is possible under current build limits
 
     global starttime
     starttime = dt.datetime.now()
     print("Optimisation starts at", starttime)
  
-    lb = []
-    ub = []
-
-    lb = [0.]  * pzones + [0.] * wzones + [0.] *  (nodes * steps) + [0.]
-    ub = [PVBuildRateLimit] * pzones + [WindBuildRateLimit]  * wzones + [50.] *  nodes + [50.] * (nodes * (steps - 1)) + [5000.]
-
-
-    result = differential_evolution(
-        x0=initial_guess,  #Initial guess starts with result from last run
-        func=parallel_object_wrapper, 
-        bounds=list(zip(lb, ub)), 
-        tol=0,
-        maxiter=args.i, 
-        popsize=args.p, 
-        mutation=(0.2,args.m), 
-        recombination=args.r,
-        disp=True, 
-        polish=False, 
-        updating='deferred',
-        callback=callback, 
-        workers=1,
-        vectorized=True,
-        )
+    lb, ub = scenario.bounds()
+
+
+    func, screens, cache, reduced, tag = objective(args, scenario)
+    if args.w > 1:
+        screens, cache = [], None # Each island builds and reports its own
+
+    global log, counter
+    counter = func = Counter(func)
+    log = IterationLog('Results/Optimisation_result_node(s){}_steps{}_{}{}.npy'.format(args.n, args.steps, starttime.strftime('%Y%m%d-%H%M%S'), run), len(lb))
+    for screen in screens:
+        if isinstance(screen, Profile):
+            screen.open(log.path[:-len('.npy')] + '_profile.csv')
+
+    # The solver is driven directly (as differential_evolution() does) so that its state can be checkpointed
+    global solver, checkpoint, iteration_count
+    solver, iteration_count = None, 0 # main() may be called more than once in a process by Sweep
+    checkpoint = (checkpointfile, tag)
+    try:
+        if args.w > 1:
+            result = Islands.run(args, initial_guess, log, starttime)
+        elif args.optimiser == 'cmaes':
+            result = CMAES(func, lb, ub, x0=initial_guess, popsize=args.p, sigma=args.sigma, maxiter=args.i, rng=np.random.default_rng(args.seed), callback=callback).solve()
+        else:
+            with DifferentialEvolutionSolver(
+                x0=initial_guess,  #Initial guess starts with result from last run
+                func=func, 
+                bounds=list(zip(lb, ub)), 
+                tol=0,
+                maxiter=args.i, 
+                popsize=args.p, 
+                mutation=(0.2,args.m), 
+                recombination=args.r,
+                rng=np.random.default_rng(args.seed),
+                disp=True, 
+                polish=False, 
+                updating='deferred',
+                callback=callback, 
+                workers=1,
+                vectorized=True,
+                ) as solver:
+
+                if args.resume:
+                    iteration_count = Checkpoint.restore(*checkpoint, solver=solver, surrogate=model(screens))
+                    solver.maxiter = max(args.i - iteration_count, 0)
+                    for screen in screens:
+                        screen.update(solver.population_energies)
+
+                result = solver.solve()
+    finally:
+        log.close()
+
+    for screen in screens:
+        screen.report()
+    if cache is not None:
+        cache.report()
+        if args.memofile:
+            cache.save()
+
+    # Validate the result of the reduced time series at full resolution
+    if reduced:
+        validated = parallel_object_wrapper(np.ascontiguousarray(result.x.reshape(-1, 1)), data)[0]
+        print("Objective on reduced time series:", result.fun)
+        print("Objective at full resolution:", validated, "(reduction error {:.2%})".format((result.fun - validated) / validated))
+        result.fun = validated
+
+    if args.polish > 0:
+        result = polish(result, data, lb, ub, log.path[:-len('.npy')] + '_polish.csv')
 
     # Print the best solution and its objective function value
     print("Best solution:", result.x)
@@ -196,6 +630,7 @@ def main():
 
     endtime = dt.datetime.now()
     print("Optimisation took", endtime - starttime)
+    return result
 
 if __name__=='__main__':
     main()
@@ -0,0 +1,207 @@
+# Optimiser backends for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# A backend minimises a vectorised objective func(xs), xs(v, c) holding one candidate per column, within bounds lb, ub.
+# Like scipy's DifferentialEvolutionSolver it is run with solve(), calls callback(intermediate_result) once per
+# generation with an OptimizeResult (x, fun, nfev, nit, population_energies) and returns an OptimizeResult, so the
+# callback, results log and screening work the same with every backend.
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+def scale(u, lb, ub):
+    """Decision variables of unit-scaled u"""
+    return lb + u * (ub - lb)
+
+
+def unscale(x, lb, ub):
+    """x scaled to the unit cube of the bounds, clipped to it. Variables fixed by their bounds are 0"""
+    span = np.where(ub > lb, ub - lb, 1)
+    return np.clip((x - lb) / span, 0, 1)
+
+
+class Counter:
+    """Counts the candidates a vectorised objective is evaluated on. scipy counts a vectorised call as one evaluation,
+    so this is the count that compares backends"""
+
+    def __init__(self, func):
+        self.func = func
+        self.nfev = 0
+
+    def __call__(self, xs):
+        self.nfev += xs.shape[1]
+        return self.func(xs)
+
+
+class CMAES:
+    """(mu/mu_w, lambda) covariance matrix adaptation evolution strategy (Hansen, The CMA Evolution Strategy: A
+    Tutorial, 2016) on the unit-scaled decision variables. Each generation of popsize samples is evaluated in one call
+    of func. Samples outside the bounds are evaluated and recombined at the nearest point within them"""
+
+    def __init__(self, func, lb, ub, x0=None, popsize=None, sigma=0.3, maxiter=1000, rng=None, callback=None, disp=True):
+        self.func = func
+        self.lb, self.ub = np.asarray(lb, dtype=np.float64), np.asarray(ub, dtype=np.float64)
+        self.maxiter = maxiter
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.callback = callback
+        self.disp = disp
+
+        n = len(self.lb)
+        self.n = n
+        self.popsize = max(popsize or 0, 4 + int(3 * np.log(n)))
+        self.mu = self.popsize // 2
+        weights = np.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1 / (self.weights ** 2).sum()
+
+        # Learning rates and damping
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+        self.damps = 1 + 2 * max(0, np.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chiN = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+        self.mean = unscale(np.asarray(x0, dtype=np.float64), self.lb, self.ub) if x0 is not None else np.full(n, 0.5)
+        self.sigma = sigma
+        self.C = np.eye(n)
+        self.B, self.D = np.eye(n), np.ones(n)
+        self.pc, self.ps = np.zeros(n), np.zeros(n)
+        self.eigen = 0 # Generation of the last decomposition of C
+
+        self.x, self.fun = None, np.inf
+        self.nfev, self.nit = 0, 0
+
+    def __next__(self):
+        """Samples, evaluates and selects one generation"""
+        n, mu, weights = self.n, self.mu, self.weights
+
+        Z = self.rng.standard_normal((self.popsize, n))
+        U = np.clip(self.mean + self.sigma * (Z * self.D) @ self.B.T, 0, 1) # Samples(c, v)
+        energies = self.func(np.ascontiguousarray(scale(U, self.lb, self.ub).T))
+        self.nfev += self.popsize
+        self.nit += 1
+
+        order = np.argsort(energies)
+        if energies[order[0]] < self.fun:
+            self.x, self.fun = scale(U[order[0]], self.lb, self.ub), energies[order[0]]
+
+        # Recombination and evolution paths
+        mean = self.mean
+        self.mean = weights @ U[order[:mu]]
+        y = (self.mean - mean) / self.sigma
+        self.ps = (1 - self.cs) * self.ps + np.sqrt(self.cs * (2 - self.cs) * self.mueff) * (self.B @ ((self.B.T @ y) / self.D))
+        hsig = np.linalg.norm(self.ps) / np.sqrt(1 - (1 - self.cs) ** (2 * self.nit)) / self.chiN < 1.4 + 2 / (n + 1)
+        self.pc = (1 - self.cc) * self.pc + hsig * np.sqrt(self.cc * (2 - self.cc) * self.mueff) * y
+
+        # Covariance and step size
+        Y = (U[order[:mu]] - mean) / self.sigma
+        self.C = (1 - self.c1 - self.cmu) * self.C \
+                 + self.c1 * (np.outer(self.pc, self.pc) + (1 - hsig) * self.cc * (2 - self.cc) * self.C) \
+                 + self.cmu * (Y.T * weights) @ Y
+        self.sigma *= np.exp((self.cs / self.damps) * (np.linalg.norm(self.ps) / self.chiN - 1))
+
+        # The O(n^3) decomposition is only refreshed as often as C changes appreciably
+        if self.nit - self.eigen > self.popsize / (self.c1 + self.cmu) / n / 10:
+            self.eigen = self.nit
+            self.C = np.triu(self.C) + np.triu(self.C, 1).T
+            D2, self.B = np.linalg.eigh(self.C)
+            self.D = np.sqrt(np.maximum(D2, 1e-20))
+
+        return energies
+
+    def solve(self):
+        message = 'Maximum number of iterations has been exceeded.'
+        while self.nit < self.maxiter:
+            energies = next(self)
+            if self.disp:
+                print(f"cmaes step {self.nit}: f(x)= {self.fun}")
+
+            if self.callback is not None:
+                result = OptimizeResult(x=self.x, fun=self.fun, nfev=self.nfev, nit=self.nit, population_energies=energies)
+                if self.callback(result):
+                    message = 'callback function requested stop early'
+                    break
+
+            if self.sigma * self.D.max() < 1e-12:
+                message = 'Step size below 1e-12 of the bounds.'
+                break
+
+        return OptimizeResult(x=self.x, fun=self.fun, nfev=self.nfev, nit=self.nit, message=message, success=True)
+
+
+class PatternSearch:
+    """Compass search with Hooke-Jeeves pattern moves (Kolda, Lewis and Torczon, Optimization by Direct Search, 2003)
+    on the unit-scaled decision variables, to polish the result of a global optimiser. Each iteration polls x +- step
+    along every variable, clipped to the bounds, together with the pattern move that repeats the last improvement, in
+    one call of func. x moves to the best probe that improves on it, otherwise step is halved"""
+
+    def __init__(self, func, lb, ub, x0, step=0.01, tol=1e-6, maxiter=100, callback=None, disp=True):
+        self.func = func
+        self.lb, self.ub = np.asarray(lb, dtype=np.float64), np.asarray(ub, dtype=np.float64)
+        self.step = step
+        self.tol = tol
+        self.maxiter = maxiter
+        self.callback = callback
+        self.disp = disp
+
+        self.u = unscale(np.asarray(x0, dtype=np.float64), self.lb, self.ub)
+        self.free = np.where(self.ub > self.lb)[0] # Variables fixed by their bounds aren't polled
+        self.last = None # The last improving move, repeated as the pattern move
+        self.x, self.fun, self.fun0 = scale(self.u, self.lb, self.ub), np.inf, np.inf
+        self.nfev, self.nit = 0, 0
+        self.history = [] # (nit, nfev, fun, step) of each iteration
+
+    def probes(self):
+        """Poll points(c, v) around u that differ from it after clipping"""
+        n = len(self.free)
+        U = np.tile(self.u, (2 * n, 1))
+        U[np.arange(n), self.free] += self.step
+        U[n + np.arange(n), self.free] -= self.step
+        if self.last is not None:
+            U = np.vstack((U, self.u + self.last))
+        U = np.clip(U, 0, 1)
+        return U[np.any(U != self.u, axis=1)]
+
+    def __next__(self):
+        """Evaluates the poll points of one iteration and moves to the best of them if it improves on x"""
+        U = self.probes()
+        energies = self.func(np.ascontiguousarray(scale(U, self.lb, self.ub).T))
+        self.nfev += len(U)
+        self.nit += 1
+
+        best = np.argmin(energies)
+        if energies[best] < self.fun:
+            self.last = U[best] - self.u
+            self.u, self.x, self.fun = U[best], scale(U[best], self.lb, self.ub), energies[best]
+        else:
+            self.last = None
+            self.step /= 2
+        self.history.append((self.nit, self.nfev, self.fun, self.step))
+        return energies
+
+    def solve(self):
+        # The starting point is evaluated with the same objective as the probes
+        self.fun = self.fun0 = self.func(np.ascontiguousarray(self.x.reshape(-1, 1)))[0]
+        self.nfev += 1
+        self.history.append((0, self.nfev, self.fun, self.step))
+
+        message = 'Maximum number of iterations has been exceeded.'
+        while self.nit < self.maxiter:
+            if self.step < self.tol:
+                message = 'Step size below {} of the bounds.'.format(self.tol)
+                break
+
+            energies = next(self)
+            if self.disp:
+                print(f"polish step {self.nit}: f(x)= {self.fun} ({self.fun0 - self.fun:.6g} better in {self.nfev} evaluations)")
+
+            if self.callback is not None:
+                result = OptimizeResult(x=self.x, fun=self.fun, nfev=self.nfev, nit=self.nit, population_energies=energies)
+                if self.callback(result):
+                    message = 'callback function requested stop early'
+                    break
+
+        return OptimizeResult(x=self.x, fun=self.fun, nfev=self.nfev, nit=self.nit, message=message, success=True)
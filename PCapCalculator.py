@@ -3,18 +3,34 @@
 # Licensed under the MIT Licence
 # Correspondence: owen.chenhall@gmail.com
 
+# Discription of changes (2025, Owen Chenhall)
+# - The power capacity of a step is the sum of that step's block of CPHP (the cumulative capacity of each node), in
+#   PCapSteps() which every kernel uses, rather than of every steps-th element
+
 import numpy as np
+import KernelCache # Keys the kernel cache to the sources, before any kernel is defined
 from numba import jit
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
+def PCapSteps(CPHP, steps):
+    """Storage power capacity of each step, MW. CPHP holds the cumulative capacity (GW) of each node, step by step"""
+    nodes = len(CPHP) // steps
+    Pcapacity = np.empty(steps, dtype=np.float64)
+
+    for i in range(steps):
+        Pcapacity[i] = np.sum(CPHP[i*nodes:(i+1)*nodes]) * 1e3
+
+    return Pcapacity
+
+@jit(nopython=True, cache=True)
 def PCapTCalc(CPHP, steps, intervals):
     split = intervals // steps
     Pcapacityt = np.empty((intervals, 1), dtype=np.float64)
+    Pcapacity = PCapSteps(CPHP, int(steps))
     
     for i in range(steps):
-        value = np.sum(CPHP[i::steps]) * 1e3
         start = i * split
         end = start + split
-        Pcapacityt[start:end, 0] = value
+        Pcapacityt[start:end, 0] = Pcapacity[i]
 
-    return Pcapacityt
\ No newline at end of file
+    return Pcapacityt
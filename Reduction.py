@@ -0,0 +1,76 @@
+# Representative-period time series reduction for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# Each capacity step is split into weeks which are clustered (k-means on load, PV and wind profiles). The week closest
+# to each cluster centre represents the cluster and is weighted by the number of weeks it stands for. Representative
+# weeks are stitched together in chronological order so storage carries over from one week to the next.
+
+import numpy as np
+
+def kmeans(features, k, rng, iterations=100):
+    """Cluster labels and centres of features(n, f). Empty clusters are reseeded with the worst fitting point"""
+    n = features.shape[0]
+
+    # k-means++ initialisation
+    centres = [features[rng.integers(n)]]
+    for _ in range(1, k):
+        distance = np.min([((features - c) ** 2).sum(axis=1) for c in centres], axis=0)
+        centres.append(features[rng.choice(n, p=distance / distance.sum())] if distance.sum() > 0 else features[rng.integers(n)])
+    centres = np.array(centres)
+
+    for _ in range(iterations):
+        distance = ((features[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2)
+        labels = distance.argmin(axis=1)
+        for j in range(k):
+            if not (labels == j).any():
+                worst = distance[np.arange(n), labels].argmax()
+                labels[worst] = j
+                distance[worst, :] = 0
+
+        updated = np.array([features[labels == j].mean(axis=0) for j in range(k)])
+        if np.allclose(updated, centres):
+            break
+        centres = updated
+
+    return labels, centres
+
+
+def representative_weeks(Load, PV, Wind, Baseload, steps, weeks, length=336, seed=0):
+    """Reduced Load(t), PV(t, i), Wind(t, i), Baseload(t) and weights(t) with the given number of weeks per step.
+    length is the number of intervals in a week (336 at half-hourly resolution)"""
+
+    split = len(Load) // steps
+    nweeks = split // length
+    weeks = min(weeks, nweeks)
+    rng = np.random.default_rng(seed)
+
+    # Normalise each trace so load, PV and wind contribute equally to the clustering
+    traces = [Load / Load.std(), PV.mean(axis=1) / max(PV.mean(axis=1).std(), 1e-9), Wind.mean(axis=1) / max(Wind.mean(axis=1).std(), 1e-9)]
+
+    index, weights = [], []
+    for i in range(steps):
+        start = i * split
+        features = np.hstack([x[start : start + nweeks * length].reshape(nweeks, length) for x in traces])
+        labels, centres = kmeans(features, weeks, rng)
+
+        medoids = [np.where(labels == j)[0][((features[labels == j] - centres[j]) ** 2).sum(axis=1).argmin()] for j in range(weeks)]
+        counts = np.bincount(labels, minlength=weeks) * split / (nweeks * length) # Include the partial week at the end of the step
+
+        for j in np.argsort(medoids):
+            index.append(start + medoids[j] * length + np.arange(length))
+            weights.append(np.full(length, counts[j]))
+
+    index = np.concatenate(index)
+    weights = np.concatenate(weights)
+    reduced = [np.ascontiguousarray(x[index]) for x in (Load, PV, Wind, Baseload)]
+
+    # Reduction error of the energy in each trace
+    print('Time series reduced to {} of {} intervals ({} weeks per step)'.format(len(index), len(Load), weeks))
+    for name, full, short in zip(('Load', 'PV', 'Wind', 'Baseload'), (Load, PV, Wind, Baseload), reduced):
+        total = full.sum()
+        error = (np.tensordot(weights, short, axes=1).sum() - total) / total if total != 0 else 0
+        print('• {} energy error: {:.2%}'.format(name, error))
+
+    return tuple(reduced) + (weights,)
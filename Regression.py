@@ -0,0 +1,213 @@
+# Regression checks of the evaluation kernels for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# The optimisation evaluates candidates with several kernels that must agree with F, the full-detail objective that
+# Statistics and Dispatch use: F_lean and F_parallel with transmission, F_batch without, and parallel_quantities for
+# cost sensitivities. They differ only in how arrays are laid out and reduced, so F_lean and F_parallel are expected to
+# reproduce F bit for bit and F_batch (which sums generation with a matrix product) to within rounding.
+#
+# The storage recursions (Reliability, ReliabilityDual, ReliabilityLean through F) are checked bit for bit against a
+# plain Python transcription of the original recursion, and DispatchFlexible against the original dispatch that
+# re-simulates the whole year for every interval it tries to switch off, on a short trace.
+#
+# The traces are synthetic (Input.synthetic) with flexible capacity at every node, so the checks run without the input
+# data. Failures are listed and the exit status is 1, e.g.
+#     python Regression.py
+#     python Regression.py -nodes Super1 -steps 2 -candidates 32 -seed 1
+
+import sys
+from argparse import ArgumentParser
+import numpy as np
+
+from Input import Scenario, Solution, synthetic
+from Simulation import Reliability, ReliabilityDual
+from PCapCalculator import PCapTCalc
+from Dispatch import DispatchFlexible
+from Optimisation import F, F_lean, parallel_object_wrapper, parallel_quantities
+from Benchmark import candidates
+
+parser = ArgumentParser()
+parser.add_argument('-nodes', default='Super1,NSW', type=str, required=False, help='Comma-separated nodes to check, with and without transmission')
+parser.add_argument('-steps', default='1,2', type=str, required=False, help='Comma-separated numbers of steps in capacity expansion')
+parser.add_argument('-years', default=1, type=int, required=False, help='Years of synthetic traces')
+parser.add_argument('-candidates', default=8, type=int, required=False, help='Candidates evaluated by each kernel')
+parser.add_argument('-dispatch', default=336, type=int, required=False, help='Intervals of the trace the dispatch is checked on')
+parser.add_argument('-rtol', default=1e-12, type=float, required=False, help='Relative tolerance of the kernels that reduce in another order')
+parser.add_argument('-seed', default=0, type=int, required=False, help='Seed of the traces and candidates')
+
+
+def recursion(Netload, Pcapacity, Scapacity, resolution, efficiency):
+    """The storage recursion as originally written. Netload(t) and Pcapacity(t) in MW, Scapacity in MWh. Returns the
+    discharge, charge, storage, deficit and spillage of each interval"""
+    length = len(Netload)
+    Discharge, Charge, Storage, Deficit, Spillage = [np.zeros(length) for _ in range(5)]
+
+    for t in range(length):
+        Netloadt = Netload[t]
+        Storaget_1 = Storage[t-1] if t > 0 else 0.5 * Scapacity
+
+        Discharget = min(max(0, Netloadt), Pcapacity[t], Storaget_1 / resolution)
+        Charget = min(-1 * min(0, Netloadt), Pcapacity[t], (Scapacity - Storaget_1) / efficiency / resolution)
+        Storage[t] = Storaget_1 - Discharget * resolution + Charget * resolution * efficiency
+
+        Discharge[t], Charge[t] = Discharget, Charget
+        Deficit[t] = max(Netloadt - Discharget, 0)
+        Spillage[t] = -1 * min(Netloadt + Charget, 0)
+
+    return Discharge, Charge, Storage, Deficit, Spillage
+
+
+def netload(S):
+    """Net load of a Solution, MW, summed across nodes in the order of the lean kernels"""
+    Netload = np.zeros(S.intervals)
+    for t in range(S.intervals):
+        Load, PV, Wind, Baseload = 0.0, 0.0, 0.0, 0.0
+        for j in range(S.nodes):
+            Load += S.MLoad[t, j]
+            PV += S.GPV[t, j]
+            Wind += S.GWind[t, j]
+        for j in range(S.GBaseload.shape[1]):
+            Baseload += S.GBaseload[t, j]
+        Netload[t] = Load - PV - Wind - Baseload
+    return Netload
+
+
+def dispatch(Netload, Pcapacity, Scapacity, Fcapacity, timestep, resolution, efficiency, tolerance=0.1):
+    """The original dispatch: each chunk of timestep intervals is switched off and the whole year re-simulated, keeping
+    the switch-off if the deficit stays within tolerance (MWh). Returns flexible(t) and Spillage(t), MW"""
+    length = len(Netload)
+    flexible = Fcapacity * np.ones(length)
+
+    for i in range(0, length, timestep):
+        trial = flexible.copy()
+        trial[i:i+timestep] = 0
+        Deficit = recursion(Netload - trial, Pcapacity, Scapacity, resolution, efficiency)[3]
+        if Deficit.sum() * resolution <= tolerance:
+            flexible = trial
+
+    return flexible, recursion(Netload - flexible, Pcapacity, Scapacity, resolution, efficiency)[4]
+
+
+def scarce(data, rng):
+    """A candidate whose generation is about the load and whose storage holds a few hours of it, so that storage both
+    runs out and fills up and flexible resources change the recursion. Benchmark's candidates rarely do either"""
+    x = np.empty(data.sidx + 1)
+    x[:data.widx] = rng.uniform(0, 6 * data.nodes / data.widx, data.widx) # GW
+    x[data.widx:data.sidx] = rng.uniform(0, 1, data.sidx - data.widx) / data.steps # GW
+    x[data.sidx] = rng.uniform(2, 6) * data.nodes # GWh
+    return x
+
+
+def compare(name, actual, expected, rtol=0.0):
+    """Checks that actual equals expected bit for bit, or to within rtol. Returns the failure, or None"""
+    actual, expected = np.asarray(actual, dtype=np.float64), np.asarray(expected, dtype=np.float64)
+    if actual.shape != expected.shape:
+        return "{}: shape {} instead of {}".format(name, actual.shape, expected.shape)
+    difference = np.abs(actual - expected)
+    worst = np.max(difference / np.maximum(np.abs(expected), 1e-300), initial=0.0)
+    if rtol == 0.0 and not np.array_equal(actual, expected):
+        return "{}: differs from the reference by up to {:.3g} (relative)".format(name, worst)
+    if not worst <= rtol:
+        return "{}: differs from the reference by up to {:.3g} (relative), above {:.3g}".format(name, worst, rtol)
+    return None
+
+
+def kernels(data, xs, rtol):
+    """Failures of the objective kernels against F"""
+    flexible = np.ones(data.intervals, dtype=np.float64) * data.CPeak.sum() * 1000
+    scratch = (np.empty((2, data.intervals, data.nodes)), np.empty((4, data.intervals)))
+    objective = np.array([F(np.ascontiguousarray(x), data) for x in xs.T])
+    lean = np.array([F_lean(np.ascontiguousarray(x), data, flexible, *scratch) for x in xs.T])
+
+    parallel = parallel_object_wrapper(xs, data)
+    quantities, energy, PenDeficit, PenHydro = parallel_quantities(xs, data)
+
+    return [
+        compare('F_lean', lean, objective),
+        # F_parallel (F_lean per candidate) with transmission, F_batch without
+        compare('parallel_object_wrapper', parallel, objective, 0.0 if 'Super' in data.node else rtol),
+        compare('parallel_quantities', np.dot(data.factor, quantities) / energy + PenDeficit + PenHydro, parallel, rtol),
+    ]
+
+
+def recursions(data, x):
+    """Failures of the storage recursions of a candidate against recursion()"""
+    flexible = np.ones(data.intervals, dtype=np.float64) * data.CPeak.sum() * 1000
+    S = Solution(x, data)
+    Netload = netload(S)
+    Pcapacity = PCapTCalc(S.CPHP, int(S.steps), S.intervals)[:, 0]
+    Scapacity = S.CPHS * 1000
+
+    NoFlex = recursion(Netload, Pcapacity, Scapacity, S.resolution, S.efficiency)
+    Flex = recursion(Netload - flexible, Pcapacity, Scapacity, S.resolution, S.efficiency)
+    sums = np.array([np.cumsum(NoFlex[3])[-1], np.cumsum(Flex[3])[-1]]) # Accumulated in order, as the kernels do
+
+    failures = [compare('ReliabilityDual', ReliabilityDual(S, flexible, False), sums),
+                compare('ReliabilityDual(output=True)', ReliabilityDual(S, flexible, True), sums)]
+    for name, trajectory, reference in zip(('Discharge', 'Charge', 'Storage', 'Deficit', 'Spillage'),
+                                           (S.Discharge, S.Charge, S.Storage, S.Deficit, S.Spillage), Flex):
+        failures.append(compare('ReliabilityDual {}'.format(name), trajectory[0], reference))
+
+    # Reliability() nets the load with numpy's reductions, so it is checked on its own net load
+    S = Solution(x, data)
+    Netload = S.MLoad.sum(axis=1) - S.GPV.sum(axis=1) - S.GWind.sum(axis=1) - S.GBaseload.sum(axis=1) - flexible
+    failures.append(compare('Reliability Deficit', Reliability(S, flexible), recursion(Netload, Pcapacity, Scapacity, S.resolution, S.efficiency)[3]))
+    return failures
+
+
+def dispatches(data, x, length):
+    """Failures of DispatchFlexible against dispatch() on the first length intervals of a candidate. Generation is
+    scaled to the mean load and storage to a couple of hours of it, so that some switch-offs are kept and some
+    rejected. Flexible capacity covers the peak net load, so the year is reliable before any switch-off"""
+    S = Solution(x, data)
+    Load = S.MLoad.sum(axis=1)[:length] - S.GBaseload.sum(axis=1)[:length]
+    Generation = S.GPV.sum(axis=1)[:length] + S.GWind.sum(axis=1)[:length]
+    Netload = Load - Generation * Load.mean() / Generation.mean()
+    Pcapacity = np.full(length, 0.5 * Load.mean())
+    Scapacity = 2 * Load.mean()
+    Fcapacity = Netload.max()
+
+    failures = []
+    for timestep in (1, 4):
+        reference = dispatch(Netload, Pcapacity, Scapacity, Fcapacity, timestep, S.resolution, S.efficiency)
+        kept = int((reference[0] == 0).sum())
+        print("    dispatch timestep {}: {} of {} intervals switched off".format(timestep, kept, length))
+        for merge in (1e-6, 0.0):
+            flexible, Spillage = DispatchFlexible(Netload, Pcapacity, Scapacity, Fcapacity, timestep, S.resolution, S.efficiency, 0.1, merge)
+            name = 'DispatchFlexible timestep {} merge {:g}'.format(timestep, merge)
+            failures += [compare(name + ' flexible', flexible, reference[0]), compare(name + ' Spillage', Spillage, reference[1])]
+    return failures
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    failures = []
+
+    for node in args.nodes.split(','):
+        for steps in [int(s) for s in args.steps.split(',')]:
+            data = synthetic(Scenario(node=node, steps=steps), intervals=int(args.years * 8760 / 0.5), seed=args.seed)
+            # synthetic() has no hydro or bio, so flexible capacity is added to exercise the flexible recursion
+            data = data._replace(CPeak=np.linspace(0.5, 2, data.nodes))
+            xs = candidates(data, args.candidates, rng)
+            xs[:, 0] = scarce(data, rng)
+            x = np.ascontiguousarray(xs[:, 0])
+
+            print("Regression: {} ({} nodes), {} steps, {} intervals".format(node, data.nodes, steps, data.intervals))
+            checks = kernels(data, xs, args.rtol) + kernels(data._replace(CPeak=np.zeros(data.nodes)), xs, args.rtol) + recursions(data, x)
+            if steps == 1:
+                checks += dispatches(data, x, args.dispatch)
+
+            failed = ['{} {} steps, {}'.format(node, steps, failure) for failure in checks if failure is not None]
+            print("  {} of {} checks passed".format(len(checks) - len(failed), len(checks)))
+            failures += failed
+
+    for failure in failures:
+        print("FAILED", failure)
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
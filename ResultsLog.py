@@ -0,0 +1,105 @@
+# Per-iteration results log of the optimiser for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# Records (iteration, evaluations, elapsed seconds, objective, x) are put on a bounded queue by the optimiser callback and written
+# by a background thread, so a slow disk never holds up the evaluation of the next generation. The file is an .npy
+# array of fixed-width records. Its header is written with room for any record count and rewritten at every flush, so
+# the file can be opened with np.load (or load() below) while the optimisation is still running. Every optimiser
+# backend writes the same records, so runs can be compared by the evaluations taken to reach an objective.
+
+import queue
+import threading
+import time
+import numpy as np
+
+magic = b'\x93NUMPY\x01\x00'
+
+def record_dtype(ndim):
+    return np.dtype([('iteration', np.int64), ('nfev', np.int64), ('elapsed', np.float64), ('objective', np.float64), ('x', np.float64, (ndim,))])
+
+
+def header(dtype, count, length=None):
+    """.npy version 1.0 header for count records, padded with spaces to length bytes (or a multiple of 64)"""
+    text = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(np.lib.format.dtype_to_descr(dtype), count)
+    if length is None:
+        length = -(-(len(magic) + 2 + len(text) + 20 + 1) // 64) * 64 # 20 digits is room for any count
+    text = text.ljust(length - len(magic) - 2 - 1) + '\n'
+    return magic + np.uint16(len(text)).tobytes() + text.encode('latin1')
+
+
+class IterationLog:
+    """Append-only binary log of the optimiser's progress. Records that arrive while the queue is full are dropped
+    (and counted) rather than blocking the caller"""
+
+    def __init__(self, path, ndim, flush_interval=5.0, maxsize=1000):
+        self.path = path
+        self.dtype = record_dtype(ndim)
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.count = 0
+        self.dropped = 0
+
+        self.file = open(path, 'wb')
+        self.file.write(header(self.dtype, 0))
+        self.headerlength = self.file.tell()
+
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+
+    def append(self, iteration, nfev, elapsed, objective, x):
+        record = np.zeros(1, dtype=self.dtype)
+        record['iteration'], record['nfev'], record['elapsed'], record['objective'], record['x'] = iteration, nfev, elapsed, objective, x
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def writer(self):
+        last = time.monotonic()
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = None
+
+            if record is not None and record is not self.queue:
+                self.file.write(record.tobytes())
+                self.count += 1
+
+            if record is self.queue or time.monotonic() - last >= self.flush_interval:
+                self.flush()
+                last = time.monotonic()
+            if record is self.queue: # Sentinel put by close()
+                return
+
+    def flush(self):
+        """Writes buffered records and then the header counting them, so readers never see a record count the data
+        does not have"""
+        self.file.flush()
+        self.file.seek(0)
+        self.file.write(header(self.dtype, self.count, self.headerlength))
+        self.file.seek(0, 2)
+        self.file.flush()
+
+    def close(self):
+        self.queue.put(self.queue)
+        self.thread.join()
+        self.file.close()
+        if self.dropped:
+            print("Results log: {} records dropped while the queue was full".format(self.dropped))
+
+
+def load(path):
+    """Records of a log, memory-mapped. Complete records after the last flush are included as well"""
+    with open(path, 'rb') as f:
+        np.lib.format.read_magic(f)
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        offset = f.tell()
+        f.seek(0, 2)
+        count = (f.tell() - offset) // dtype.itemsize
+
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
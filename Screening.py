@@ -0,0 +1,63 @@
+# Multi-fidelity screening of candidate solutions for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# Candidates are first evaluated on block-averaged traces. Averaging within a block lets surplus and deficit offset
+# each other, so the coarse objective is an optimistic estimate of the full-resolution objective. Only candidates whose
+# estimate could beat the worst member of the current population are promoted to the full evaluation. The rest keep
+# their estimate, which is above the population's worst and so is always rejected by differential evolution.
+
+import numpy as np
+
+def aggregate(TS, steps, block, mean=True):
+    """Block means (or sums) of TS(t, ...) taken within each capacity step so that step boundaries are preserved"""
+    split = TS.shape[0] // steps
+    starts = np.arange(0, split, block)
+    lengths = np.diff(np.append(starts, split)).astype(np.float64)
+
+    coarse = []
+    for i in range(steps):
+        sums = np.add.reduceat(TS[i*split : (i+1)*split], starts, axis=0)
+        coarse.append(sums / lengths.reshape((-1,) + (1,) * (TS.ndim - 1)) if mean else sums)
+
+    return np.ascontiguousarray(np.concatenate(coarse))
+
+
+def aggregate_weights(weights, steps, block):
+    """Weights of the coarse intervals, in units of coarse intervals. A short final block in a step counts for less"""
+    return aggregate(weights, steps, block, mean=False) / block
+
+
+class Screen:
+    """Vectorised objective that promotes candidates from a coarse to the full evaluation.
+    coarse and full both map a population xs(v, c) to an objective vector"""
+
+    def __init__(self, coarse, full, margin=0.1):
+        self.coarse = coarse
+        self.full = full
+        self.margin = margin
+        self.threshold = np.inf # Worst objective in the current population
+
+        self.candidates = 0
+        self.promoted = 0
+
+    def __call__(self, xs):
+        estimate = self.coarse(xs)
+        promote = estimate - self.margin * np.abs(estimate) <= self.threshold
+
+        result = estimate.copy()
+        if promote.any():
+            result[promote] = self.full(np.ascontiguousarray(xs[:, promote]))
+
+        self.candidates += len(estimate)
+        self.promoted += int(promote.sum())
+        return result
+
+    def update(self, population_energies):
+        """Called once per generation with the energies of the population after selection"""
+        self.threshold = np.max(population_energies)
+
+    def report(self):
+        saved = 1 - self.promoted / self.candidates if self.candidates else 0
+        print("Screening: {} of {} candidates promoted to full evaluation ({:.1%} saved)".format(self.promoted, self.candidates, saved))
@@ -0,0 +1,154 @@
+# Cost-factor sensitivity for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# The cost of a candidate is linear in the cost factors (Data/factor.csv): cost = factor . quantities, where the
+# quantities (capacities, transmission, hydro energy and the legacy terms) come from the simulation. Each candidate is
+# simulated once (Optimisation.parallel_quantities) and its objective under any number of alternative factor vectors
+# is one matrix product, LCOE(s, c) = factors(s, f) . quantities(f, c) / energy(c) + penalties(c).
+#
+# Factors are sampled by Monte Carlo, multiplying each by an independent uniform draw within +-spread, or on a full
+# grid of levels of the factors named with -grid. The candidates are the optimised x of the scenario by default, or the
+# population of a checkpoint (.npz) or the best candidates of an iteration log (.npy) with -archive, which are then
+# ranked again under each factor vector, e.g.
+#     python Sensitivity.py -n NSW -steps 2 -samples 10000 -spread 0.3
+#     python Sensitivity.py -n Super1 -grid PV,Wind,PHS -levels 0.5,1,1.5 -archive "Results/Checkpoint_node(s)Super1_steps1.npz"
+
+import csv
+import itertools
+import os
+from argparse import ArgumentParser
+import numpy as np
+
+import ResultsLog
+from Input import Scenario
+from Optimisation import parallel_quantities
+
+parser = ArgumentParser()
+parser.add_argument('-n', default='Super1', type=str, required=False, help='node=Super1')
+parser.add_argument('-steps', default=1, type=int, required=False, help='Number of steps in capacity expansion')
+parser.add_argument('-s', default=1, type=int, required=False, help='11, 12, 13, ...')
+parser.add_argument('-samples', default=1000, type=int, required=False, help='Monte Carlo samples of the cost factors')
+parser.add_argument('-spread', default=0.2, type=float, required=False, help='Relative range of each sampled factor, e.g. 0.2 for +-20%%')
+parser.add_argument('-grid', default='', type=str, required=False, help='Comma-separated factors to vary on a grid instead of sampling, e.g. PV,Wind')
+parser.add_argument('-levels', default='0.8,1,1.2', type=str, required=False, help='Comma-separated multiples of each factor on the grid')
+parser.add_argument('-archive', default='', type=str, required=False, help='Checkpoint (.npz) or iteration log (.npy) of candidates to rank')
+parser.add_argument('-seed', default=0, type=int, required=False, help='Seed of the samples')
+parser.add_argument('-o', default='', type=str, required=False, help='Results file. Results/Sensitivity_node(s){n}_steps{steps}.csv by default')
+
+
+def names(factor, path='Data/factor.csv'):
+    """Names of the cost factors, as in Data/factor.csv"""
+    names = list(np.genfromtxt(path, dtype=str, delimiter=',', usecols=0, ndmin=1))
+    return names if len(names) == len(factor) else ['factor{}'.format(i) for i in range(len(factor))]
+
+
+def quantities(xs, data):
+    """Cost quantities(f, c), levelised energy(c) and penalties(c) of candidates xs(v, c), simulated once"""
+    quantities, energy, PenDeficit, PenHydro = parallel_quantities(np.asfortranarray(xs, dtype=np.float64), data)
+    return quantities, np.broadcast_to(energy, PenDeficit.shape), PenDeficit + PenHydro
+
+
+def lcoe(quantities, energy, penalties, factors):
+    """Objective of each candidate under each factor vector, LCOE(s, c)"""
+    return np.dot(factors, quantities) / energy + penalties
+
+
+def montecarlo(factor, samples, spread, rng):
+    """factors(s, f) with each factor scaled by an independent uniform multiple in [1 - spread, 1 + spread]"""
+    return factor * rng.uniform(1 - spread, 1 + spread, (samples, len(factor)))
+
+
+def grid(factor, names, vary, levels):
+    """factors(s, f) on the full grid of levels (multiples) of the factors named in vary. Returns it with the
+    multiples of the varied factors of each sample"""
+    columns = [names.index(name) for name in vary]
+    multiples = np.array(list(itertools.product(levels, repeat=len(columns))), dtype=np.float64)
+    factors = np.tile(factor, (len(multiples), 1))
+    factors[:, columns] *= multiples
+    return factors, multiples
+
+
+def archive(path, lb, ub):
+    """Candidates xs(v, c) of a checkpoint's population or of the distinct best candidates of an iteration log"""
+    if path.endswith('.npz'):
+        with np.load(path) as saved:
+            population = saved['population'] # Scaled to [0, 1] by the solver
+        return (lb + population * (ub - lb)).T
+
+    records = ResultsLog.load(path)
+    if len(records) == 0:
+        raise ValueError("{} has no records".format(path))
+    return np.unique(np.asarray(records['x']), axis=0).T
+
+
+def latest(n, steps):
+    """The last optimised x of the scenario, as Optimisation writes it"""
+    with open('Results/Optimisation_result_node(s){}_steps{}.csv'.format(n, steps), 'r') as f:
+        lines = f.readlines()
+    return np.array([float(x) for x in lines[-1].strip().split(',')]).reshape(-1, 1)
+
+
+def summary(objective, base):
+    """Statistics of each candidate (column) across the factor samples (rows), with its objective and rank under the
+    base factors"""
+    ranks = np.argsort(np.argsort(objective, axis=1), axis=1)
+    best = np.bincount(np.argmin(objective, axis=1), minlength=objective.shape[1])
+    return {
+        'Base': base,
+        'Mean': objective.mean(axis=0),
+        'Std': objective.std(axis=0),
+        'P5': np.percentile(objective, 5, axis=0),
+        'P50': np.percentile(objective, 50, axis=0),
+        'P95': np.percentile(objective, 95, axis=0),
+        'Base rank': np.argsort(np.argsort(base)) + 1,
+        'Mean rank': ranks.mean(axis=0) + 1,
+        'Best share': best / len(objective),
+    }
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    scenario = Scenario(node=args.n, steps=args.steps, scenario=args.s)
+    data = scenario.data
+    lb, ub = [np.array(b) for b in scenario.bounds()]
+    factornames = names(data.factor)
+
+    xs = archive(args.archive, lb, ub) if args.archive else latest(args.n, args.steps)
+    Q, E, P = quantities(xs, data)
+
+    if args.grid:
+        vary = args.grid.split(',')
+        levels = [float(level) for level in args.levels.split(',')]
+        factors, multiples = grid(data.factor, factornames, vary, levels)
+        print("Sensitivity: {} candidates on a grid of {} factor vectors of {}".format(xs.shape[1], len(factors), ', '.join(vary)))
+    else:
+        factors = montecarlo(data.factor, args.samples, args.spread, np.random.default_rng(args.seed))
+        print("Sensitivity: {} candidates under {} samples of the factors within +-{:.0%}".format(xs.shape[1], len(factors), args.spread))
+
+    objective = lcoe(Q, E, P, factors)
+    stats = summary(objective, lcoe(Q, E, P, data.factor))
+
+    path = args.o or 'Results/Sensitivity_node(s){}_steps{}.csv'.format(args.n, args.steps)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Candidate'] + list(stats) + ['x'])
+        for c in range(xs.shape[1]):
+            writer.writerow([c] + [stats[k][c] for k in stats] + [' '.join(str(v) for v in xs[:, c])])
+
+    # The objective of each candidate under each factor vector, e.g. to plot the grid
+    np.savez(path[:-len('.csv')] + '.npz', names=factornames, factors=factors, objective=objective, xs=xs,
+             **({'multiples': multiples, 'vary': vary} if args.grid else {}))
+
+    order = np.argsort(stats['Mean rank'])
+    for c in order[:5]:
+        print("  Candidate {}: base {:.4f}, mean {:.4f} (P5 {:.4f}, P95 {:.4f}), mean rank {:.1f}, best in {:.0%}".format(
+            c, stats['Base'][c], stats['Mean'][c], stats['P5'][c], stats['P95'][c], stats['Mean rank'][c], stats['Best share'][c]))
+    print("Results written to", path)
+    return stats
+
+
+if __name__ == '__main__':
+    main()
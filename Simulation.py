@@ -7,10 +7,29 @@
 
 # Discription of changes (2025, Owen Chenhall)
 # - Added support capacity expansion under FIRM_CE
+# - ReliabilityBatch() to simulate a population of candidate solutions in one pass
+# - ReliabilityDual() to simulate with and without flexible resources in one pass
+# - StorageStep() holds the recursion of a single interval so it can be resumed from a saved storage state
+# - Interval weights in ReliabilityBatch() for reduced (representative or block-averaged) time series
+# - ReliabilityBatch() is cached on disk. Kernels taking a Solution are not: a jitclass argument can't be cached, so
+#   they are compiled into the cached kernels that construct the Solution instead
+# - ReliabilityLean() runs ReliabilityDual() on arrays (e.g. per-thread scratch buffers) without a Solution, and
+#   ReliabilityDual() is ReliabilityLean() on the arrays of the Solution. Every recursion steps through StorageStep()
 
 import numpy as np
-from numba import jit
-from PCapCalculator import PCapTCalc
+import KernelCache # Keys the kernel cache to the sources, before any kernel is defined
+from numba import jit, prange
+from PCapCalculator import PCapSteps, PCapTCalc
+
+@jit(nopython=True, cache=True)
+def StorageStep(Netloadt, Pcapacityt, Scapacity, Storaget_1, resolution, efficiency):
+    """One interval of the storage recursion. Returns discharge, charge (MW) and storage at the end of the interval (MWh)"""
+    Discharget = min(max(0, Netloadt), Pcapacityt, Storaget_1 / resolution)
+    Charget = min(-1 * min(0, Netloadt), Pcapacityt, (Scapacity - Storaget_1) / efficiency / resolution)
+    Storaget = Storaget_1 - Discharget * resolution + Charget * resolution * efficiency
+
+    return Discharget, Charget, Storaget
+
 
 @jit(nopython=True)
 def Reliability(solution, flexible):
@@ -31,9 +50,7 @@ def Reliability(solution, flexible):
         Netloadt = Netload[t]
         Storaget_1 = Storage[t-1] if t>0 else 0.5 * Scapacity
 
-        Discharget = min(max(0, Netloadt), Pcapacity[t,0], Storaget_1 / solution.resolution)
-        Charget = min(-1 * min(0, Netloadt), Pcapacity[t,0], (Scapacity - Storaget_1) / solution.efficiency / solution.resolution)
-        Storaget = Storaget_1 - Discharget * solution.resolution + Charget * solution.resolution * solution.efficiency
+        Discharget, Charget, Storaget = StorageStep(Netloadt, Pcapacity[t,0], Scapacity, Storaget_1, solution.resolution, solution.efficiency)
 
         Discharge[t] = Discharget
         Charge[t] = Charget
@@ -50,3 +67,130 @@ def Reliability(solution, flexible):
     solution.Deficit = np.atleast_2d(Deficit)
 
     return Deficit
+
+
+@jit(nopython=True)
+def ReliabilityDual(solution, flexible, output=False):
+    """Runs the storage recursion without flexible resources (to size hydro) alongside the recursion with flexible.
+    Returns both energy deficits, MW summed over intervals. The trajectories with flexible are only kept when output=True"""
+
+    Pcapacity = PCapSteps(solution.CPHP, int(solution.steps)) # S-CPHP(j), GW to MW
+    Scapacity = solution.CPHS * 1000 # S-CPHS(j), GWh to MWh
+
+    if not output:
+        return ReliabilityLean(solution.MLoad, solution.GPV, solution.GWind, solution.GBaseload, Pcapacity, Scapacity, flexible, solution.resolution, solution.efficiency)
+
+    Trajectories = np.zeros((5, solution.intervals))
+    DeficitNoFlex_sum, Deficit_sum = ReliabilityLean(solution.MLoad, solution.GPV, solution.GWind, solution.GBaseload, Pcapacity, Scapacity, flexible, solution.resolution, solution.efficiency, Trajectories)
+
+    solution.flexible = np.atleast_2d(flexible)
+    solution.Discharge = np.atleast_2d(Trajectories[0])
+    solution.Charge = np.atleast_2d(Trajectories[1])
+    solution.Deficit = np.atleast_2d(Trajectories[2])
+    solution.Spillage = np.atleast_2d(Trajectories[3])
+    solution.Storage = np.atleast_2d(Trajectories[4])
+
+    return DeficitNoFlex_sum, Deficit_sum
+
+
+@jit(nopython=True, cache=True)
+def ReliabilityLean(MLoad, GPV, GWind, GBaseload, Pcapacity, Scapacity, flexible, resolution, efficiency, Trajectories=None):
+    """ReliabilityDual() on the arrays of a solution. Pcapacity(s) is the storage power capacity of each step (MW), as
+    PCapSteps() gives it. Returns both energy deficits, MW summed over intervals. Discharge, charge, deficit and spillage
+    with flexible are written to the rows of Trajectories(4, t) if it is given, and storage to a fifth row if it has one"""
+    intervals, nodes = MLoad.shape
+    steps = len(Pcapacity)
+    split = intervals // steps
+
+    Storaget_0 = 0.5 * Scapacity # Without flexible
+    Storaget_1 = 0.5 * Scapacity # With flexible
+    DeficitNoFlex_sum, Deficit_sum = 0.0, 0.0
+
+    for t in range(intervals):
+        Pcapacityt = Pcapacity[min(t // split, steps - 1)]
+
+        Load, PV, Wind, Baseload = 0.0, 0.0, 0.0, 0.0
+        for j in range(nodes):
+            Load += MLoad[t, j]
+            PV += GPV[t, j]
+            Wind += GWind[t, j]
+        for j in range(GBaseload.shape[1]):
+            Baseload += GBaseload[t, j]
+
+        Netloadt = Load - PV - Wind - Baseload
+        Discharget, Charget, Storaget_0 = StorageStep(Netloadt, Pcapacityt, Scapacity, Storaget_0, resolution, efficiency)
+        DeficitNoFlex_sum += max(Netloadt - Discharget, 0)
+
+        Netloadt = Netloadt - flexible[t]
+        Discharget, Charget, Storaget_1 = StorageStep(Netloadt, Pcapacityt, Scapacity, Storaget_1, resolution, efficiency)
+        Deficitt = max(Netloadt - Discharget, 0)
+        Deficit_sum += Deficitt
+
+        if Trajectories is not None:
+            Trajectories[0, t] = Discharget
+            Trajectories[1, t] = Charget
+            Trajectories[2, t] = Deficitt
+            Trajectories[3, t] = -1 * min(Netloadt + Charget, 0)
+            if Trajectories.shape[0] > 4:
+                Trajectories[4, t] = Storaget_1
+
+    return DeficitNoFlex_sum, Deficit_sum
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def ReliabilityBatch(CPV, CWind, Pcapacity, Scapacity, Load, TSPV, TSWind, Baseload, flexible, weights, resolution, efficiency, blocksize=8, chunk=2048):
+    """Storage recursion for a population of candidates, with and without flexible resources in the same pass.
+    Returns the energy deficits of each candidate (without flexible, with flexible), MW summed over intervals
+
+    Candidates are the innermost axis of every input so each interval updates the whole population together:
+    CPV(s, i, c), CWind(s, i, c) cumulative capacity in GW for step s, Pcapacity(s, c) in MW and Scapacity(c) in MWh.
+    Load(t), Baseload(t) and flexible(t) are summed across nodes, MW. weights(t) is the number of times each
+    simulated interval recurs in the horizon it represents (ones at full resolution)
+
+    Threads work on blocks of blocksize candidates, streaming the traces in chunks of intervals"""
+
+    steps, ncand = Pcapacity.shape
+    intervals = len(Load)
+    split = intervals // steps
+
+    nblocks = -(-ncand // blocksize)
+    DeficitNoFlex = np.zeros(ncand)
+    Deficit = np.zeros(ncand)
+
+    for b in prange(nblocks):
+        c0 = b * blocksize
+        c1 = min(c0 + blocksize, ncand)
+        if c0 >= c1:
+            continue
+        n = c1 - c0
+
+        StorageNoFlex = 0.5 * Scapacity[c0:c1].copy() # MWh
+        Storage = 0.5 * Scapacity[c0:c1].copy() # MWh
+        DeficitNoFlexb = np.zeros(n)
+        Deficitb = np.zeros(n)
+
+        for s in range(steps):
+            CPVs = np.ascontiguousarray(CPV[s, :, c0:c1]) * 1000 # GW to MW
+            CWinds = np.ascontiguousarray(CWind[s, :, c0:c1]) * 1000 # GW to MW
+            Pcap = Pcapacity[s, c0:c1]
+            Scap = Scapacity[c0:c1]
+
+            for t0 in range(s * split, (s + 1) * split, chunk):
+                t1 = min(t0 + chunk, (s + 1) * split)
+                Generation = np.dot(TSPV[t0:t1], CPVs) + np.dot(TSWind[t0:t1], CWinds) # G(t, c), MW
+
+                for t in range(t0, t1):
+                    Residual = Load[t] - Baseload[t]
+                    for c in range(n):
+                        Netloadt = Residual - Generation[t - t0, c]
+                        Discharget, Charget, StorageNoFlex[c] = StorageStep(Netloadt, Pcap[c], Scap[c], StorageNoFlex[c], resolution, efficiency)
+                        DeficitNoFlexb[c] += weights[t] * max(Netloadt - Discharget, 0)
+
+                        Netloadt = Netloadt - flexible[t]
+                        Discharget, Charget, Storage[c] = StorageStep(Netloadt, Pcap[c], Scap[c], Storage[c], resolution, efficiency)
+                        Deficitb[c] += weights[t] * max(Netloadt - Discharget, 0)
+
+        DeficitNoFlex[c0:c1] = DeficitNoFlexb
+        Deficit[c0:c1] = Deficitb
+
+    return DeficitNoFlex, Deficit
\ No newline at end of file
@@ -1,106 +1,190 @@
 # Load profiles and generation mix data (LPGM) & energy generation, storage and transmission information (GGTA)
 # based on x/capacities from Optimisation and flexible from Dispatch
 # Copyright (c) 2019, 2020 Bin Lu, The Australian National University
+# Modifications (c) 2025 Owen Chenhall
 # Licensed under the MIT Licence
 # Correspondence: bin.lu@anu.edu.au
 
-from Input import *
-from Simulation import Reliability
-from Network import Transmission
+# Discription of changes (2025, Owen Chenhall)
+# - Time series of the Solution are broken down to nodes in Report, as the jitclass can't take new attributes. Takes
+#   the single storage of FIRM_CE, the capacities of the last step and the lines of Data/lines.csv
+# - Debug() checks the balance, storage and capacities of all intervals at once
+# - Timestamps are formatted once per day and once per time of day and combined as arrays
+# - Results are streamed to CSV in chunks of intervals, optionally with a binary columnar copy (.npz), and the
+#   per-node files are written in parallel
+# - The breakdown to nodes is Network.Breakdown(), the same as the line capacities of the objective, with the storage
+#   power shares of each step. System-wide baseload is apportioned by share of load and the net imports are checked
+#   to balance
 
 import numpy as np
 import datetime as dt
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from Input import Scenario, Linesfile
+from Simulation import Reliability
+from Network import Breakdown
+
+chunk = 17520 # Intervals formatted and written at a time
+
+def lines(path=Linesfile):
+    """Names of the lines, 'From-To', in the order of the columns of TDC(t, k)"""
+    lines = np.genfromtxt(path, dtype=None, delimiter=',', encoding=None, skip_header=1, ndmin=1)
+    return [line[0] for line in lines], ['{}-{}'.format(line[1], line[2]) for line in lines]
+
+
+class Report:
+    """Time series of a simulated Solution and their breakdown to nodes (Network.Breakdown)"""
+
+    def __init__(self, solution, flexible, scenario):
+        intervals, nodes, steps = scenario.intervals, scenario.nodes, scenario.steps
+
+        self.MLoad, self.GPV, self.GWind = solution.MLoad, solution.GPV, solution.GWind # MW, per node
+        self.Discharge, self.Charge, self.Storage = solution.Discharge[0], solution.Charge[0], solution.Storage[0]
+        self.Deficit, self.Spillage, self.flexible = solution.Deficit[0], solution.Spillage[0], flexible
+        self.Baseload = solution.GBaseload.sum(axis=1)
+        self.efficiency = solution.efficiency
+
+        # Capacities at the last step, GW and GWh
+        self.CPV, self.CWind, self.CPHP = [C[len(C) - len(C) // steps:] for C in (solution.CPV, solution.CWind, solution.CPHP)]
+        self.CPHS = solution.CPHS
 
-def Debug(solution):
+        # Breakdown to the nodes in each interval, as the line capacities of the objective take it
+        MImport, Components = Breakdown(self.MLoad, self.GPV, self.GWind, solution.GBaseload, solution.CPHP, scenario.CPeak, steps, flexible,
+                                        self.Deficit, self.Spillage, self.Charge, self.Discharge, self.Storage)
+        self.MPV, self.MWind = self.GPV, self.GWind
+        self.MBaseload, self.MPeak, self.MDeficit, self.MSpillage, self.MDischarge, self.MCharge, self.MStorage = Components
+
+        if nodes > 1:
+            imbalance = np.abs(MImport.sum(axis=1)) # The flows of unbalanced imports would be a least-squares fit
+            assert imbalance.max() <= 1, 'Net imports of the nodes do not balance at interval {} by {} MW'.format(imbalance.argmax(), imbalance.max())
+            self.TDC = MImport @ solution.Flowmap # TDC(t, k), MW
+            self.Topology = self.TDC @ np.linalg.pinv(solution.Flowmap) # Net flow into each node, TDC(t, k) . Incidence(j, k)^T
+        else:
+            self.TDC = np.zeros((intervals, len(scenario.DCloss)))
+            self.Topology = np.zeros((intervals, nodes))
+        self.CDC = np.amax(np.abs(self.TDC), axis=0) * pow(10, -3) # CDC(k), MW to GW
+
+        self.MHydro = np.minimum((scenario.CHydro - scenario.CBaseload) * pow(10, 3), self.MPeak) # GW to MW
+        self.MBio = self.MPeak - self.MHydro
+        self.MHydro = self.MHydro + self.MBaseload
+
+
+def Debug(solution, scenario):
     """Debugging"""
+    resolution = scenario.resolution
 
     Load, PV, Wind = (solution.MLoad.sum(axis=1), solution.GPV.sum(axis=1), solution.GWind.sum(axis=1))
-    Baseload, Peak = (solution.MBaseload.sum(axis=1), solution.MPeak.sum(axis=1))
+    Baseload, Peak = (solution.Baseload, solution.flexible)
 
-    Discharge, Charge, Storage, P2V = (solution.Discharge, solution.Charge, solution.Storage, solution.P2V)
-    DischargeD, ChargeD, StorageD = (solution.DischargeD, solution.ChargeD, solution.StorageD)
-    Deficit, DeficitD, Spillage = (solution.Deficit, solution.DeficitD, solution.Spillage)
+    Discharge, Charge, Storage = (solution.Discharge, solution.Charge, solution.Storage)
+    Deficit, Spillage = (solution.Deficit, solution.Spillage)
 
-    PHS, DS = solution.CPHS * pow(10, 3), sum(solution.CDS) * pow(10, 3) # GWh to MWh
-    efficiency, efficiencyD = solution.efficiency, solution.efficiencyD
+    PHS = solution.CPHS * pow(10, 3) # GWh to MWh
+    efficiency = solution.efficiency
 
-    for i in range(intervals):
-        # Energy supply-demand balance
-        assert abs(Load[i] + Charge[i] + ChargeD[i] + Spillage[i]
-                   - PV[i] - Wind[i] - Baseload[i] - Peak[i] - Discharge[i] + P2V[i] - Deficit[i]) <= 1
+    # Energy supply-demand balance
+    balance = np.abs(Load + Charge + Spillage - PV - Wind - Baseload - Peak - Discharge - Deficit)
+    assert balance.max() <= 1, 'Energy is not balanced at interval {} by {} MW'.format(balance.argmax(), balance.max())
 
-        # Discharge, Charge and Storage
-        if i==0:
-            assert abs(Storage[i] - 0.5 * PHS + Discharge[i] * resolution - Charge[i] * resolution * efficiency) <= 1
-            assert abs(StorageD[i] - 0.5 * DS + DischargeD[i] * resolution - ChargeD[i] * resolution * efficiencyD) <= 1
-        else:
-            assert abs(Storage[i] - Storage[i - 1] + Discharge[i] * resolution - Charge[i] * resolution * efficiency) <= 1
-            assert abs(StorageD[i] - StorageD[i - 1] + DischargeD[i] * resolution - ChargeD[i] * resolution * efficiencyD) <= 1
-
-        # Capacity: PV, wind, Discharge, Charge and Storage
-        try:
-            assert np.amax(PV) <= sum(solution.CPV) * pow(10, 3), print(np.amax(PV) - sum(solution.CPV) * pow(10, 3))
-            assert np.amax(Wind) <= sum(solution.CWind) * pow(10, 3), print(np.amax(Wind) - sum(solution.CWind) * pow(10, 3))
-
-            assert np.amax(Discharge) <= sum(solution.CPHP) * pow(10, 3), print(np.amax(Discharge) - sum(solution.CPHP) * pow(10, 3))
-            assert np.amax(Charge) <= sum(solution.CPHP) * pow(10, 3), print(np.amax(Charge) - sum(solution.CPHP) * pow(10, 3))
-            assert np.amax(Storage) <= solution.CPHS * pow(10, 3), print(np.amax(Storage) - solution.CPHS * pow(10, 3))
-            assert np.amax(DischargeD) <= sum(solution.CDP) * pow(10, 3), print(np.amax(DischargeD) - sum(solution.CDP) * pow(10, 3))
-            assert np.amax(ChargeD) <= sum(solution.CDP) * pow(10, 3), print(np.amax(ChargeD) - sum(solution.CDP) * pow(10, 3))
-            assert np.amax(StorageD) <= sum(solution.CDS) * pow(10, 3), print(np.amax(StorageD) - sum(solution.CDS) * pow(10, 3))
-        except AssertionError:
-            pass
+    # Discharge, Charge and Storage
+    Storage_1 = np.concatenate(([0.5 * PHS], Storage[:-1]))
+    recursion = np.abs(Storage - Storage_1 + Discharge * resolution - Charge * resolution * efficiency)
+    assert recursion.max() <= 1, 'Storage does not follow charge and discharge at interval {} by {} MWh'.format(recursion.argmax(), recursion.max())
+
+    # Capacity: PV, wind, Discharge, Charge and Storage. Excesses are reported but not fatal
+    for name, peak, capacity in [('PV', PV.max(), solution.CPV.sum()), ('Wind', Wind.max(), solution.CWind.sum()),
+                                 ('Discharge', Discharge.max(), solution.CPHP.sum()), ('Charge', Charge.max(), solution.CPHP.sum()),
+                                 ('Storage', Storage.max(), solution.CPHS)]:
+        if peak > capacity * pow(10, 3):
+            print('{} exceeds its capacity by {}'.format(name, peak - capacity * pow(10, 3)))
 
     print('Debugging: everything is ok')
 
     return True
 
-def LPGM(solution):
+
+def timestamps(firstyear, start, stop, resolution):
+    """'%a %-d %b %Y %H:%M' of intervals start to stop counted from the beginning of firstyear"""
+    per_day = int(round(24 / resolution))
+    t = np.arange(start, stop)
+    first, last = start // per_day, (stop - 1) // per_day
+
+    origin = dt.datetime(firstyear, 1, 1)
+    days = np.array([(origin + dt.timedelta(days=d)).strftime('%a %-d %b %Y ') for d in range(first, last + 1)])
+    times = np.array([(origin + dt.timedelta(minutes=60 * resolution * i)).strftime('%H:%M') for i in range(per_day)])
+    return np.char.add(days[t // per_day - first], times[t % per_day])
+
+
+def write(path, header, C, firstyear, resolution, columnar=False):
+    """Writes the columns of C(t, c), rounded to MW/MWh, to a CSV with the timestamp of each interval first. With
+    columnar, also writes them unrounded to an .npz of one array per column"""
+    intervals = C.shape[0]
+    fmt = '%s' + ',%d' * C.shape[1] + '\n'
+
+    with open(path, 'w') as f:
+        f.write(header + '\n')
+        for start in range(0, intervals, chunk):
+            stop = min(start + chunk, intervals)
+            stamps = timestamps(firstyear, start, stop, resolution)
+            values = np.around(C[start:stop]).astype(np.int64).tolist()
+            f.write(''.join([fmt % (stamp, *row) for stamp, row in zip(stamps, values)]))
+
+    if columnar:
+        start = np.datetime64('{}-01-01T00:00'.format(firstyear))
+        columns = dict(zip(header.split(',')[1:], C.T))
+        np.savez(os.path.splitext(path)[0] + '.npz', **{'Date & time': start + np.arange(intervals) * np.timedelta64(int(60 * resolution), 'm')}, **columns)
+
+    return path
+
+
+def LPGM(solution, scenario, columnar=False):
     """Load profiles and generation mix data"""
+    nodes, resolution, firstyear = scenario.nodes, scenario.resolution, scenario.firstyear
 
-    Debug(solution)
+    Debug(solution, scenario)
 
-    C = np.stack([(solution.MLoad + solution.MLoadD).sum(axis=1), (solution.MLoad + solution.MChargeD + solution.MP2V).sum(axis=1),
+    C = np.stack([solution.MLoad.sum(axis=1), solution.MLoad.sum(axis=1),
                   solution.MHydro.sum(axis=1), solution.MBio.sum(axis=1), solution.GPV.sum(axis=1), solution.GWind.sum(axis=1),
                   solution.Discharge, solution.Deficit, -1 * solution.Spillage, -1 * solution.Charge,
-                  solution.Storage,
-                  solution.FQ, solution.NQ, solution.NS, solution.NV, solution.AS, solution.SW, solution.TV])
-    C = np.around(C.transpose())
-
-    datentime = np.array([(dt.datetime(firstyear, 1, 1, 0, 0) + x * dt.timedelta(minutes=60 * resolution)).strftime('%a %-d %b %Y %H:%M') for x in range(intervals)])
-    C = np.insert(C.astype('str'), 0, datentime, axis=1)
+                  solution.Storage], axis=1)
+    C = np.hstack((C, solution.TDC))
 
     header = 'Date & time,Operational demand (original),Operational demand (adjusted),' \
              'Hydropower,Biomass,Solar photovoltaics,Wind,Pumped hydro energy storage,Energy deficit,Energy spillage,PHES-Charge,' \
-             'PHES-Storage,' \
-             'FNQ-QLD,NSW-QLD,NSW-SA,NSW-VIC,NT-SA,SA-WA,TAS-VIC'
-
-    np.savetxt('Results/S{}.csv'.format(scenario), C, fmt='%s', delimiter=',', header=header, comments='')
+             'PHES-Storage,' + ','.join(lines()[1])
+    files = [('Results/S{}.csv'.format(scenario.scenario), header, C)]
 
-    if scenario>=21:
+    if nodes > 1:
         header = 'Date & time,Operational demand (original),Operational demand (adjusted),' \
                  'Hydropower,Biomass,Solar photovoltaics,Wind,Pumped hydro energy storage,Energy deficit,Energy spillage,' \
                  'Transmission,PHES-Charge,' \
                  'PHES-Storage'
 
-        Topology = solution.Topology[np.where(np.in1d(np.array(['FNQ', 'NSW', 'NT', 'QLD', 'SA', 'TAS', 'VIC', 'WA']), coverage) == True)[0]]
-
         for j in range(nodes):
-            C = np.stack([(solution.MLoad + solution.MLoadD)[:, j], (solution.MLoad + solution.MChargeD + solution.MP2V)[:, j],
+            C = np.stack([solution.MLoad[:, j], solution.MLoad[:, j],
                           solution.MHydro[:, j], solution.MBio[:, j], solution.MPV[:, j], solution.MWind[:, j],
-                          solution.MDischarge[:, j], solution.MDeficit[:, j], -1 * solution.MSpillage[:, j], Topology[j], -1 * solution.MCharge[:, j],
-                          solution.MStorage[:, j]])
-            C = np.around(C.transpose())
-
-            C = np.insert(C.astype('str'), 0, datentime, axis=1)
-            np.savetxt('Results/S{}{}.csv'.format(scenario, solution.Nodel[j]), C, fmt='%s', delimiter=',', header=header, comments='')
+                          solution.MDischarge[:, j], solution.MDeficit[:, j], -1 * solution.MSpillage[:, j], solution.Topology[:, j], -1 * solution.MCharge[:, j],
+                          solution.MStorage[:, j]], axis=1)
+            files.append(('Results/S{}{}.csv'.format(scenario.scenario, scenario.Nodel[j]), header, C))
+
+    # Formatting is bound to the interpreter, so the files are written by separate processes
+    if len(files) > 1:
+        with ProcessPoolExecutor(max_workers=min(os.cpu_count(), len(files)), mp_context=mp.get_context('spawn')) as pool:
+            for future in [pool.submit(write, path, header, C, firstyear, resolution, columnar) for path, header, C in files]:
+                future.result()
+    else:
+        write(*files[0], firstyear, resolution, columnar)
 
     print('Load profiles and generation mix is produced.')
 
     return True
 
-def GGTA(solution):
+def GGTA(solution, scenario):
     """GW, GWh, TWh p.a. and A$/MWh information"""
+    resolution, years, MLoad, DCloss = scenario.resolution, scenario.years, scenario.MLoad, scenario.DCloss
+    CHydro, CBio = scenario.CHydro, scenario.CBio
 
     factor = np.genfromtxt('Data/factor.csv', dtype=None, delimiter=',', encoding=None)
     factor = dict(factor)
@@ -118,17 +202,17 @@ def GGTA(solution):
     CostHydro = factor['Hydro'] * GHydro # A$b p.a.
     CostBio = factor['Hydro'] * GBio # A$b p.a.
     CostPH = factor['PHP'] * CPHP + factor['PHS'] * CPHS # A$b p.a.
-    if scenario>=21:
+    if scenario.scenario>=21:
         CostPH -= factor['LegPH']
 
-    CostDC = np.array([factor['FQ'], factor['NQ'], factor['NS'], factor['NV'], factor['AS'], factor['SW'], factor['TV']])
+    CostDC = np.array([factor[line] for line in lines()[0]])
     CostDC = (CostDC * solution.CDC).sum() # A$b p.a.
-    if scenario>=21:
+    if scenario.scenario>=21:
         CostDC -= factor['LegINTC']
 
     CostAC = factor['ACPV'] * CPV + factor['ACWind'] * CWind # A$b p.a.
 
-    Energy = (MLoad + MLoadD).sum() * pow(10, -9) * resolution / years # PWh p.a.
+    Energy = MLoad.sum() * pow(10, -9) * resolution / years # PWh p.a.
     Loss = np.sum(abs(solution.TDC), axis=0) * DCloss
     Loss = Loss.sum() * pow(10, -9) * resolution / years # PWh p.a.
 
@@ -156,62 +240,32 @@ def GGTA(solution):
     print('\u2022 LCOB-Transmission:', LCOBT)
     print('\u2022 LCOB-Spillage & loss:', LCOBL)
 
-    D = np.zeros((1, 22))
-    D[0, :] = [Energy * pow(10, 3), Loss * pow(10, 3), CPV, GPV, CWind, GWind, CapHydrobio, GHydrobio, CPHP, CPHS] \
-              + list(solution.CDC) \
-              + [LCOE, LCOG, LCOBS, LCOBT, LCOBL]
+    D = np.array([[Energy * pow(10, 3), Loss * pow(10, 3), CPV, GPV, CWind, GWind, CapHydrobio, GHydrobio, CPHP, CPHS]
+                  + list(solution.CDC)
+                  + [LCOE, LCOG, LCOBS, LCOBT, LCOBL]])
 
-    np.savetxt('Results/GGTA{}.csv'.format(scenario), D, fmt='%f', delimiter=',')
+    np.savetxt('Results/GGTA{}.csv'.format(scenario.scenario), D, fmt='%f', delimiter=',')
     print('Energy generation, storage and transmission information is produced.')
 
     return True
 
-def Information(x, flexible):
-    """Dispatch: Statistics.Information(x, Flex)"""
+def Information(x, flexible, scenario, columnar=False):
+    """Dispatch: Statistics.Information(x, Flex, scenario)"""
+    resolution = scenario.resolution
 
     start = dt.datetime.now()
     print("Statistics start at", start)
 
-    S = Solution(x)
-    Deficit, DeficitD = Reliability(S, flexible=flexible)
-
-    try:
-        assert (Deficit + DeficitD).sum() * resolution < 0.1, 'Energy generation and demand are not balanced.'
-    except AssertionError:
-        pass
-
-    if scenario>=21:
-        S.TDC = Transmission(S, output=True) # TDC(t, k), MW
-    else:
-        S.TDC = np.zeros((intervals, len(DCloss))) # TDC(t, k), MW
-
-        S.MPeak = np.tile(flexible, (nodes, 1)).transpose() # MW
-        S.MBaseload = GBaseload.copy() # MW
+    S = scenario.Solution(x)
+    Deficit = Reliability(S, flexible=flexible)
 
-        S.MPV = S.GPV.sum(axis=1) if S.GPV.shape[1]>0 else np.zeros((intervals, 1))
-        S.MWind = S.GWind.sum(axis=1) if S.GWind.shape[1]>0 else np.zeros((intervals, 1))
+    if Deficit.sum() * resolution >= 0.1:
+        print('Energy generation and demand are not balanced.')
 
-        S.MDischarge = np.tile(S.Discharge, (nodes, 1)).transpose()
-        S.MDeficit = np.tile(S.Deficit, (nodes, 1)).transpose()
-        S.MCharge = np.tile(S.Charge, (nodes, 1)).transpose()
-        S.MStorage = np.tile(S.Storage, (nodes, 1)).transpose()
-        S.MSpillage = np.tile(S.Spillage, (nodes, 1)).transpose()
+    R = Report(S, flexible, scenario)
 
-        S.MChargeD = np.tile(S.ChargeD, (nodes, 1)).transpose()
-        S.MP2V = np.tile(S.P2V, (nodes, 1)).transpose()
-
-    S.CDC = np.amax(abs(S.TDC), axis=0) * pow(10, -3) # CDC(k), MW to GW
-    S.FQ, S.NQ, S.NS, S.NV, S.AS, S.SW, S.TV = map(lambda k: S.TDC[:, k], range(S.TDC.shape[1]))
-
-    S.MHydro = np.tile(CHydro - CBaseload, (intervals, 1)) * pow(10, 3) # GW to MW
-    S.MHydro = np.minimum(S.MHydro, S.MPeak)
-    S.MBio = S.MPeak - S.MHydro
-    S.MHydro += S.MBaseload
-
-    S.Topology = np.array([-1 * S.FQ, -1 * (S.NQ + S.NS + S.NV), -1 * S.AS, S.FQ + S.NQ, S.NS + S.AS - S.SW, -1 * S.TV, S.NV + S.TV, S.SW])
-
-    LPGM(S)
-    GGTA(S)
+    LPGM(R, scenario, columnar)
+    GGTA(R, scenario)
 
     end = dt.datetime.now()
     print("Statistics took", end - start)
@@ -219,6 +273,11 @@ def Information(x, flexible):
     return True
 
 if __name__ == '__main__':
+    from Optimisation import parser
+    parser.add_argument('-columnar', action='store_true', help='Also write the time series as .npz of one array per column')
+    args = parser.parse_args()
+    scenario = Scenario(node=args.n, steps=args.steps, scenario=args.s)
+
     capacities = np.genfromtxt('Results/Optimisation_resultx17.csv', delimiter=',')
     flexible = np.genfromtxt('Results/Dispatch_Flexible17.csv', delimiter=',', skip_header=1)
-    Information(capacities, flexible)
\ No newline at end of file
+    Information(capacities, flexible, scenario, args.columnar)
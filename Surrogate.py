@@ -0,0 +1,104 @@
+# Surrogate-assisted pre-screening of candidate solutions for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# A radial basis function model is fitted to the most recent candidates evaluated by the objective. It ranks each
+# generation and only the most promising fraction is evaluated. The rest are given their prediction, raised to just
+# above the worst member of the current population so that an optimistic prediction can never displace a member that
+# was evaluated. Objective values span orders of magnitude once penalties apply, so the model is fitted to
+# log(1 + f - min f).
+
+import numpy as np
+
+class RBF:
+    """Cubic radial basis function interpolant with a linear tail, on inputs scaled to the unit cube"""
+
+    def __init__(self, X, y, lb, ub, ridge=1e-8):
+        self.lb, self.span = lb, np.where(ub > lb, ub - lb, 1)
+        U = (X - self.lb) / self.span
+        n, d = U.shape
+
+        Phi = self.kernel(U, U)
+        P = np.hstack((np.ones((n, 1)), U))
+        A = np.zeros((n + d + 1, n + d + 1))
+        A[:n, :n] = Phi + ridge * max(np.abs(Phi).max(), 1) * np.eye(n) # Regularised against repeated candidates
+        A[:n, n:] = P
+        A[n:, :n] = P.T
+
+        b = np.concatenate((y, np.zeros(d + 1)))
+        coefficients = np.linalg.lstsq(A, b, rcond=None)[0]
+        self.U, self.weights, self.tail = U, coefficients[:n], coefficients[n:]
+
+    @staticmethod
+    def kernel(U, V):
+        distance2 = (U * U).sum(1)[:, None] + (V * V).sum(1)[None, :] - 2 * U @ V.T
+        return np.sqrt(np.maximum(distance2, 0)) ** 3
+
+    def __call__(self, X):
+        U = (X - self.lb) / self.span
+        return self.kernel(U, self.U) @ self.weights + self.tail[0] + U @ self.tail[1:]
+
+
+class Surrogate:
+    """Vectorised objective evaluating only the fraction of each population that a surrogate model ranks best.
+    full maps a population xs(v, c) to an objective vector"""
+
+    def __init__(self, full, lb, ub, fraction=0.3, size=500, minimum=None):
+        self.full = full
+        self.lb, self.ub = np.asarray(lb, dtype=np.float64), np.asarray(ub, dtype=np.float64)
+        self.fraction = fraction
+        self.size = size # Most recent evaluations the model is fitted to
+        self.minimum = minimum or 2 * (len(self.lb) + 1) # Evaluations before the model is used
+        self.threshold = np.inf # Worst objective in the current population
+
+        self.X = np.zeros((0, len(self.lb)))
+        self.y = np.zeros(0)
+
+        self.candidates = 0
+        self.evaluated = 0
+        self.errors = [] # Relative error of predictions that were then evaluated
+        self.correlations = [] # Rank correlation of predictions and objectives within a generation
+
+    def __call__(self, xs):
+        ncand = xs.shape[1]
+        self.candidates += ncand
+
+        if len(self.y) < self.minimum:
+            result = self.full(xs)
+            self.add(xs.T, result)
+            self.evaluated += ncand
+            return result
+
+        offset = self.y.min()
+        model = RBF(self.X, np.log1p(self.y - offset), self.lb, self.ub)
+        prediction = np.expm1(model(xs.T)) + offset
+
+        evaluate = np.argsort(prediction)[:max(1, int(np.ceil(self.fraction * ncand)))]
+        result = np.maximum(prediction, np.nextafter(self.threshold, np.inf))
+        result[evaluate] = self.full(np.ascontiguousarray(xs[:, evaluate]))
+        self.add(xs[:, evaluate].T, result[evaluate])
+        self.evaluated += len(evaluate)
+
+        true = result[evaluate]
+        self.errors.extend(np.abs(prediction[evaluate] - true) / np.maximum(np.abs(true), 1e-12))
+        if len(evaluate) > 2:
+            ranks = [np.argsort(np.argsort(v)) for v in (prediction[evaluate], true)]
+            self.correlations.append(np.corrcoef(*ranks)[0, 1])
+        return result
+
+    def add(self, X, y):
+        finite = np.isfinite(y)
+        self.X = np.vstack((self.X, X[finite]))[-self.size:]
+        self.y = np.concatenate((self.y, y[finite]))[-self.size:]
+
+    def update(self, population_energies):
+        """Called once per generation with the energies of the population after selection"""
+        self.threshold = np.max(population_energies)
+
+    def report(self):
+        saved = 1 - self.evaluated / self.candidates if self.candidates else 0
+        print("Surrogate: {} of {} candidates evaluated ({:.1%} saved)".format(self.evaluated, self.candidates, saved))
+        if self.errors:
+            correlation = np.nanmean(self.correlations) if self.correlations else np.nan
+            print("Surrogate: median relative error {:.2%}, mean rank correlation {:.2f}".format(np.median(self.errors), correlation))
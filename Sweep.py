@@ -0,0 +1,146 @@
+# Scenario sweeps for FIRM_CE
+# Copyright (c) 2025 Owen Chenhall
+# Licensed under the MIT Licence
+# Correspondence: owen.chenhall@gmail.com
+
+# Runs a declarative list of scenarios through Optimisation.main() in a pool of worker processes, each with a budget of
+# numba threads, instead of one subprocess at a time. Kernels are compiled into the on-disk cache once before the
+# workers start. Workers are reused between jobs so a scenario's data stay loaded for the next job on the same node(s),
+# and all workers map the same pages of the InputCache. A job table records each job as it finishes so that an
+# interrupted sweep skips the jobs already done when it is run again.
+#
+# A scenario is a dict of Optimisation options by flag name, with an optional list of seeds to repeat it with, e.g.
+#     {'n': 'NSW', 'steps': 2, 'p': 20, 'i': 1000, 'seeds': [0, 1, 2]}
+# Options without a value (e.g. 'warmup') are given as True.
+
+import csv
+import datetime as dt
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
+from numba import set_num_threads
+
+import Optimisation
+
+def expand(scenarios):
+    """(name, options) of each job in a list of scenarios"""
+    jobs = []
+    for scenario in scenarios:
+        options = dict(scenario)
+        seeds = options.pop('seeds', [options.pop('seed', None)])
+        for seed in seeds:
+            job = dict(options, seed=seed) if seed is not None else dict(options)
+            jobs.append(('_'.join('{}{}'.format(k, v) for k, v in job.items()), job))
+    return jobs
+
+
+def arguments(name, options):
+    """Command line of Optimisation for the options of a job. The initial guess prompt is answered with no, and the job
+    name keeps its log and checkpoint apart from those of other jobs of the scenario"""
+    argv = ['-guess', 'n', '-job', name]
+    for flag, value in options.items():
+        if value is True:
+            argv.append('-' + flag)
+        elif value is not False:
+            argv += ['-' + flag, str(value)]
+    return argv
+
+
+def job(name, options, threads, logdir):
+    """Worker. Runs one job with its output and errors going to logdir/name.txt. Returns the objective and runtime in
+    seconds"""
+    set_num_threads(threads)
+    start = time.perf_counter()
+    path = os.path.join(logdir, name + '.txt')
+    with open(path, 'a') as f, redirect_stdout(f), redirect_stderr(f):
+        try:
+            result = Optimisation.main(arguments(name, options))
+        except SystemExit as e: # parser.error(), which would otherwise end the sweep rather than fail the job
+            f.flush()
+            raise RuntimeError('Optimisation exited with status {}: {} (see {}.txt)'.format(e.code, last(path), name)) from None
+    if result is None:
+        raise RuntimeError('Optimisation returned no result (e.g. -warmup)')
+    return float(result.fun), time.perf_counter() - start
+
+
+def last(path):
+    """The last line written to a job's log, e.g. the error parser.error() exited with"""
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return lines[-1] if lines else ''
+
+
+def save(table, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(table, f, indent=1)
+    os.replace(tmp, path)
+
+
+def summarise(table, path):
+    """Writes the LCOE and runtime of each finished job"""
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Job', 'Node(s)', 'Steps', 'Popsize', 'Maxiter', 'Seed', 'LCOE', 'Runtime (s)'])
+        for name, entry in table.items():
+            if entry['status'] == 'done':
+                options = entry['options']
+                writer.writerow([name, options.get('n'), options.get('steps'), options.get('p'), options.get('i'), options.get('seed'), entry['lcoe'], entry['runtime']])
+
+
+def run(scenarios, cores=None, budget=1, table='Results/Sweep_jobs.json', summary='Results/Sweep_summary.csv', logdir='Results/Sweep_logs'):
+    """Runs the jobs of scenarios that are not done in table, (cores // budget) at a time with budget threads each"""
+    cores = cores or os.cpu_count()
+    workers = max(1, cores // budget)
+    os.makedirs(logdir, exist_ok=True)
+
+    jobs = expand(scenarios)
+    if os.path.exists(table):
+        with open(table) as f:
+            done = json.load(f)
+    else:
+        done = {}
+    pending = [(name, options) for name, options in jobs if done.get(name, {}).get('status') != 'done']
+    print("Sweep: {} jobs, {} done, {} to run on {} workers of {} threads".format(len(jobs), len(jobs) - len(pending), len(pending), workers, budget))
+
+    # Compile once before the workers start so that they load the kernels from the on-disk cache
+    for node, steps in sorted({(options.get('n', 'Super1'), int(options.get('steps', 1))) for name, options in pending}):
+        Optimisation.warmup(node=node, steps=steps)
+
+    start = dt.datetime.now()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) as pool:
+        futures = {pool.submit(job, name, options, budget, logdir): (name, options) for name, options in pending}
+        for future in as_completed(futures):
+            name, options = futures[future]
+            try:
+                lcoe, runtime = future.result()
+                done[name] = {'options': options, 'status': 'done', 'lcoe': lcoe, 'runtime': runtime}
+                print("Sweep: {} finished, LCOE {} in {:.0f} s".format(name, lcoe, runtime))
+            except Exception as e:
+                done[name] = {'options': options, 'status': 'failed', 'error': repr(e)}
+                print("Sweep: {} failed: {!r}".format(name, e))
+            save(done, table)
+
+    summarise(done, summary)
+    print("Sweep took", dt.datetime.now() - start)
+    return done
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('scenarios', type=str, help='JSON file with a list of scenarios')
+    parser.add_argument('-cores', default=None, type=int, required=False, help='Cores to use. All by default')
+    parser.add_argument('-budget', default=1, type=int, required=False, help='Cores (numba threads) per scenario')
+    parser.add_argument('-table', default='Results/Sweep_jobs.json', type=str, required=False, help='Job table. Jobs done in it are skipped')
+    parser.add_argument('-summary', default='Results/Sweep_summary.csv', type=str, required=False, help='LCOE and runtime of each job')
+    args = parser.parse_args()
+
+    with open(args.scenarios) as f:
+        scenarios = json.load(f)
+    done = run(scenarios, args.cores, args.budget, args.table, args.summary)
+    sys.exit(1 if any(entry['status'] != 'done' for entry in done.values()) else 0)
@@ -25,10 +25,14 @@ def run_script(script_path, args=None, stdin_input=None):
     return result.returncode
 
 if __name__ == "__main__":
-    run_script("Optimisation.py", ["-i", "1","-p", "5", "-n", "NSW", "-steps", "1"],stdin_input="n\n") # A simple test for function
-
-    # run_script("Optimisation.py", ["-i", "1000","-p", "20", "-n", "NSW", "-steps", "1"],stdin_input="n\n")
-    # run_script("Optimisation.py", ["-i", "1000","-p", "20", "-n", "NSW", "-steps", "2"],stdin_input="n\n")
-    # run_script("Optimisation.py", ["-i", "2000","-p", "20", "-n", "NSW", "-steps", "4"],stdin_input="n\n")
-    # run_script("Optimisation.py", ["-i", "2000","-p", "40", "-n", "NSW", "-steps", "8"],stdin_input="n\n")
+    # Scenarios run in-process by Sweep. run_script() is kept for one-off runs of other scripts
+    from Sweep import run
 
+    scenarios = [
+        {'n': 'NSW', 'steps': 1, 'i': 1, 'p': 5}, # A simple test for function
+        # {'n': 'NSW', 'steps': 1, 'i': 1000, 'p': 20},
+        # {'n': 'NSW', 'steps': 2, 'i': 1000, 'p': 20},
+        # {'n': 'NSW', 'steps': 4, 'i': 2000, 'p': 20},
+        # {'n': 'NSW', 'steps': 8, 'i': 2000, 'p': 40},
+    ]
+    run(scenarios, budget=1)